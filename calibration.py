@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import logging
+import tracemalloc
+import multiprocessing
+import numpy as np
+from conversion_functions import burrows_wheeler_conversion, revert_burrows_wheeler, SA_ENGINES, REVERT_ENGINES, ENGINE_THRESHOLDS
+
+
+# Sequence lengths used to benchmark the engines: the small ones find the length below which the doubling engine is the fastest,
+# the large ones find the length from which the linear-time engine is the fastest.
+SMALL_LENGTHS = [16, 32, 64, 128, 256, 512, 1024]
+LARGE_LENGTHS = [2**16, 2**18, 2**20]
+REVERT_LENGTHS = [2**12, 2**14, 2**16]
+
+# Linear-time suffix array engines that can be selected for huge or repetitive sequences.
+LINEAR_ENGINES = ["sais", "dc3"]
+
+
+def synthetic_dna(length, repetitive=False, seed=0):
+    """
+    Function to generate a synthetic DNA sequence (bytes) of the received length. The sequence is made of random bases or,
+    if repetitive, of a tandem repeat of a short random unit.
+    """
+    rng = np.random.default_rng(seed)
+    bases = np.frombuffer(b"ACGT", dtype=np.uint8)
+    if repetitive:
+        return np.resize(rng.choice(bases, 9), length).tobytes()
+    return rng.choice(bases, length).tobytes()
+
+
+def time_call(function, *args, repeats=3):
+    """
+    Function to return the best time (in seconds) over a number of calls of the received function.
+    """
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(function, *args):
+    """
+    Function to return the peak memory (in bytes) allocated during a call of the received function, as traced by tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        function(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_engines():
+    """
+    Function to benchmark each suffix array engine and each inverse BWT engine on synthetic DNA of several lengths.
+    It returns a dictionary with the best time of each engine for each length (the lengths are stored as strings to be saved in JSON).
+    """
+
+    benchmarks = {"sa": {}, "sa_repetitive": {}, "sa_memory": {}, "revert": {}}
+
+    # The doubling engine is benchmarked only on the small lengths, the other engines (and the direct conversion, 
+    # without suffix array) on all of them.
+    for engine in list(SA_ENGINES) + ["direct"]:
+        lengths = SMALL_LENGTHS if engine == "doubling" else SMALL_LENGTHS + LARGE_LENGTHS
+        benchmarks["sa"][engine] = {str(length): time_call(burrows_wheeler_conversion, synthetic_dna(length), engine) for length in lengths}
+        logging.info(f"Calibration: benchmarked the {engine} suffix array engine.")
+
+    # The engines that can handle large sequences are also benchmarked on a repetitive sequence of the largest length.
+    for engine in SA_ENGINES:
+        if engine != "doubling":
+            benchmarks["sa_repetitive"][engine] = time_call(burrows_wheeler_conversion, synthetic_dna(LARGE_LENGTHS[-1], repetitive=True), engine, repeats=1)
+
+    # The peak memory (bytes per base) of the linear-time engines is measured on the largest length, since they are used for the largest sequences.
+    for engine in LINEAR_ENGINES:
+        benchmarks["sa_memory"][engine] = peak_memory(burrows_wheeler_conversion, synthetic_dna(LARGE_LENGTHS[-1]), engine) / LARGE_LENGTHS[-1]
+
+    for engine in REVERT_ENGINES:
+        benchmarks["revert"][engine] = {str(length): time_call(revert_burrows_wheeler, burrows_wheeler_conversion(synthetic_dna(length)), engine)
+                                        for length in REVERT_LENGTHS}
+        logging.info(f"Calibration: benchmarked the {engine} inverse BWT engine.")
+
+    return benchmarks
+
+
+def derive_thresholds(benchmarks):
+    """
+    Function to derive the thresholds used by the select_sa_engine function and the fastest inverse BWT engine
+    from the results of benchmark_engines.
+    """
+
+    sa = benchmarks["sa"]
+    thresholds = dict(ENGINE_THRESHOLDS)
+
+    # The doubling engine is used below the first small length at which the vectorized engine is faster.
+    faster = [length for length in SMALL_LENGTHS if sa["vectorized"][str(length)] < sa["doubling"][str(length)]]
+    thresholds["small_length"] = faster[0] if faster else SMALL_LENGTHS[-1] * 2
+
+    # The linear engine is used for the largest sequences, so it is the one with the lowest peak memory (the fastest one 
+    # on the largest length, if they need the same memory), and it is used from the first large length at which it is 
+    # faster than the vectorized engine.
+    largest = str(LARGE_LENGTHS[-1])
+    thresholds["linear_engine"] = min(LINEAR_ENGINES, key=lambda engine: (round(benchmarks["sa_memory"][engine]), sa[engine][largest]))
+    faster = [length for length in LARGE_LENGTHS if sa[thresholds["linear_engine"]][str(length)] < sa["vectorized"][str(length)]]
+    if faster:
+        thresholds["large_length"] = faster[0]
+
+    # The parallel engine is used from the first large length at which it is faster than the vectorized engine 
+    # (never, if it is not faster on any of them, e.g. on a single CPU core).
+    faster = [length for length in LARGE_LENGTHS if sa["parallel"][str(length)] < sa["vectorized"][str(length)]]
+    thresholds["parallel_length"] = faster[0] if faster else thresholds["large_length"]
+
+    # In the same way, the direct conversion is used from the first large length at which it is faster than the vectorized engine.
+    faster = [length for length in LARGE_LENGTHS if sa["direct"][str(length)] < sa["vectorized"][str(length)]]
+    thresholds["direct_length"] = faster[0] if faster else thresholds["large_length"]
+
+    # If the linear engine is not faster than the vectorized engine on repetitive sequences, the repetitiveness
+    # probe is disabled (no sequence shorter than large_length can exceed these limits).
+    repetitive = benchmarks["sa_repetitive"]
+    if repetitive[thresholds["linear_engine"]] >= repetitive["vectorized"]:
+        thresholds["min_kmer_diversity"] = 0.0
+        thresholds["max_run_length"] = float(thresholds["large_length"])
+
+    revert_engine = min(REVERT_ENGINES, key=lambda engine: benchmarks["revert"][engine][str(REVERT_LENGTHS[-1])])
+
+    return thresholds, revert_engine
+
+
+def benchmark_processes(length=2**18, n_tasks=None):
+    """
+    Function to measure the throughput (requests per second) of a pool of processes running BWT requests for
+    several pool sizes. It returns the smallest pool size reaching at least 95% of the best throughput,
+    together with the throughput of each pool size.
+    """
+
+    cpu_count = multiprocessing.cpu_count()
+    candidates = sorted({1, max(1, cpu_count - 1), cpu_count} | {2**i for i in range(cpu_count.bit_length()) if 2**i <= cpu_count})
+    n_tasks = n_tasks or 2 * candidates[-1]
+    seq = synthetic_dna(length)
+
+    throughput = {}
+    for n_processes in candidates:
+        with multiprocessing.Pool(processes=n_processes) as pool:
+            pool.map(burrows_wheeler_conversion, [seq] * n_processes)      # Warm up the processes
+            start = time.perf_counter()
+            pool.map(burrows_wheeler_conversion, [seq] * n_tasks, chunksize=1)
+            throughput[str(n_processes)] = n_tasks / (time.perf_counter() - start)
+        logging.info(f"Calibration: {n_processes} processes handle {throughput[str(n_processes)]:.2f} requests per second.")
+
+    best = max(throughput.values())
+    return min(n for n in candidates if throughput[str(n)] >= 0.95 * best), throughput
+
+
+def run_calibration(path):
+    """
+    Function to benchmark the engines and the pool sizes on the current machine, and to save the resulting
+    calibration (thresholds, inverse BWT engine, number of processes and the raw measurements) in a JSON file.
+    """
+
+    logging.info("Calibration started...")
+    benchmarks = benchmark_engines()
+    thresholds, revert_engine = derive_thresholds(benchmarks)
+    n_processes, throughput = benchmark_processes()
+    benchmarks["processes"] = throughput
+
+    calibration = {"thresholds": thresholds, "revert_engine": revert_engine, "processes": n_processes, "benchmarks": benchmarks}
+    with open(path, "w") as f:
+        json.dump(calibration, f, indent=4)
+    logging.info(f"Calibration completed and saved in {path}: thresholds {thresholds}, inverse BWT engine {revert_engine}, {n_processes} processes.")
+
+    return calibration
+
+
+def load_calibration(path):
+    """
+    Function to load a calibration file created by run_calibration. It returns None if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
@@ -1,5 +1,6 @@
 import sys
 import os
+import re
 import socket
 import argparse
 import logging
@@ -9,10 +10,10 @@ from datetime import datetime
 # Configure logging to record client activity
 logging.basicConfig(filename="client_activity.log", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filemode="a")
 
-def validation_client(host, port, file, operation):
+def validation_client(host, port, file, operation, rle=False):
     """
     The function checks for the validation of the inputs provided. If errors are generated, they are handled through logging messages and exit codes.
-    Otherwise, the function returns the parameters.
+    Otherwise, the function returns the parameters. With rle, the sequence of a REVERT operation is a BWT in the RLBWT format.
     """
     try:
         # Port and Host validation
@@ -34,19 +35,49 @@ def validation_client(host, port, file, operation):
         # Read the DNA sequence from the input file and store it in the "seq" variable 
         with open(file, "r") as f:
             header = f.readline().strip()       # Read the header
-            seq = f.read().strip().upper()      # Read the sequence removing extra whitespace and convert to upper case
-            seq = seq.replace("\n", "")         # Remove newline characters in the sequence (normally present in fasta files)
+            seq = f.read().strip()      # Read the sequence removing extra whitespace
+            if operation in ("MBWT", "MERGE"):
+                # Multi-record file: the sequences of the records (split at the following header lines) are joined by ","
+                records = [record.replace("\n", "") for record in re.split(r"\n>[^\n]*(?:\n|$)", seq)]
+                if not all(records):
+                    raise ValueError("Invalid file format: each record must contain a sequence.")
+                if operation == "MERGE" and (len(records) != 2 or not all("$" in record for record in records)):
+                    raise ValueError("Invalid operation: MERGE requires two records, each one containing a BWT with at least one '$' terminator.")
+                seq = ",".join(records)
+            else:
+                seq = seq.replace("\n", "")         # Remove newline characters in the sequence (normally present in fasta files)
+            if operation != "DECOMPRESS":
+                seq = seq.upper()      # Convert to upper case (the compressed data of DECOMPRESS is case-sensitive base64)
             # Validation of the input file
             if not header.startswith(">"):  
                 raise ValueError("Invalid file format: The header must start with '>'.")
             if not seq:
                 raise ValueError("The input file is empty.")
-            if operation == "BWT" and seq.count('$') > 0:
-                raise ValueError("Invalid operation: '$' terminator must not be present for BWT.")
+            if operation in ("BWT", "COMPRESS", "MBWT", "STORE", "APPEND") and seq.count('$') > 0:
+                raise ValueError(f"Invalid operation: '$' terminator must not be present for {operation}.")
             if operation == "REVERT" and seq.count('$') != 1:
                 raise ValueError("Invalid operation: '$' terminator must be present exactly once for REVERT.")
-            if not all(base in "ACGTRYSWKMBDHVN$" for base in seq):      # IUPAC nucleotide code
+            if operation == "MREVERT" and seq.count('$') < 1:
+                raise ValueError("Invalid operation: '$' terminator must be present at least once for MREVERT.")
+            if operation == "REVERT" and "#" in seq:
+                # BWT followed by its checkpoints (row:position pairs separated by ",")
+                seq, table = seq.split("#", 1)
+                if not re.fullmatch(r"[0-9]+:[0-9]+(,[0-9]+:[0-9]+)*", table):
+                    raise ValueError("Invalid checkpoints: they must be row:position pairs separated by ','.")
+            else:
+                table = None
+            if operation == "DECOMPRESS":
+                # Compressed data returned by the COMPRESS operation, in base64
+                if not re.fullmatch(r"[A-Za-z0-9+/]+={0,2}", seq) or len(seq) % 4 != 0:
+                    raise ValueError("Invalid compressed data: the sequence must be in base64.")
+            elif rle and operation == "REVERT":
+                # RLBWT format: each base followed by its run length (e.g. T5$1A5), greater than 0. The '$' terminator is a single run of length 1.
+                if not re.fullmatch(r"([ACGTRYSWKMBDHVN][1-9][0-9]*|\$1)+", seq):
+                    raise ValueError("Invalid RLBWT: each base must be followed by its run length (greater than 0), and '$' by 1.")
+            elif not all(base in "ACGTRYSWKMBDHVN$" or (base == "," and operation in ("MBWT", "MERGE")) for base in seq):      # IUPAC nucleotide code
                 raise ValueError("The sequence contains invalid bases.")
+            if table is not None:
+                seq = f"{seq}#{table}"
         logging.info(f"File {file} successfully opened. Sequence lenght: {len(seq)}.")
     except FileNotFoundError:
         logging.error(f"Error: file {file} not found.")
@@ -66,7 +97,10 @@ def main():
     logging.info("Starting a new request...")
 
     parser = argparse.ArgumentParser(description = "Implementation of a server along with a corresponding client to process DNA sequences.\n"
-                                     "Supported operations:\n- BWT: Burrows-Wheeler Transform.\n- REVERT: Reverse the transformation.",
+                                     "Supported operations:\n- BWT: Burrows-Wheeler Transform.\n- REVERT: Reverse the transformation.\n"
+                                     "- COMPRESS: Block-sorting compression.\n- DECOMPRESS: Reverse the compression.\n"
+                                     "- MBWT: BWT of a collection of sequences.\n- MREVERT: Reverse the collection BWT.\n"
+                                     "- MERGE: Merge two BWTs.\n- STORE: Store a sequence.\n- APPEND: Append bases to a stored sequence.",
                                      formatter_class = argparse.RawTextHelpFormatter)
 
     # Parse command-line arguments for host and port
@@ -74,17 +108,37 @@ def main():
     parser.add_argument("-p", "--port", type = int, default = 12345, help = "Port for the server. Default: 12345.")
     
     # Parse command-line arguments for operation type (BWT or REVERT) and input file with the sequence
-    parser.add_argument("-o", "--operation", required = True, choices=["BWT", "bwt", "REVERT", "revert"], help = "Operation to execute: BWT or REVERT.")
+    parser.add_argument("-o", "--operation", required = True, choices=["BWT", "bwt", "REVERT", "revert", "COMPRESS", "compress", "DECOMPRESS", "decompress",
+                        "MBWT", "mbwt", "MREVERT", "mrevert", "MERGE", "merge", "STORE", "store", "APPEND", "append"],
+                        help = "Operation to execute: BWT, REVERT, COMPRESS, DECOMPRESS, MBWT, MREVERT, MERGE, STORE or APPEND.")
+    parser.add_argument("--sa-engine", choices = ["auto", "doubling", "vectorized", "direct", "parallel", "sais", "dc3"], help = "Suffix array engine to use for the BWT, COMPRESS, MBWT and STORE operations\n"
+                        "(vectorized, sais or dc3 for MBWT, default: vectorized).\n"
+                        "Default: the engine configured on the server.")
+    parser.add_argument("--id", help = "Identifier of the stored sequence for the STORE and APPEND operations\n"
+                        "(letters, digits, '_' and '-').")
+    parser.add_argument("--rle", action = "store_true", help = "Use the run-length encoded BWT (RLBWT) format, where each run of equal bases\n"
+                        "is written as the base followed by its length (e.g. T5$1A5): the BWT operation returns it,\n"
+                        "and the REVERT operation reads it from the input file.")
+    parser.add_argument("--checkpoints", type = int, metavar = "INTERVAL", help = "Return the BWT followed by its checkpoints, one every INTERVAL bases\n"
+                        "(e.g. 65536), so that the REVERT operation can start a walk from each of them.\n"
+                        "The REVERT operation uses the checkpoints found in the input file automatically.")
+    parser.add_argument("--external", action = "store_true", help = "Request the external-memory BWT operation (for sequences larger than the\n"
+                        "memory of the server). Default: only if the sequence exceeds the external threshold of the server.")
     parser.add_argument("-f", "--file", required = True, help = "Path to the file containing the DNA sequence.\n" 
                                                                 "The input file must be a .txt or .fasta file and must contain exactly one header line," 
-                                                                "starting with `>`, followed by a single sequence.", metavar = "INPUT FILE")
+                                                                "starting with `>`, followed by a single sequence\n"
+                                                                "(one or more records, each one with its header line, for MBWT, and two records for MERGE).", metavar = "INPUT FILE")
     
     args = parser.parse_args()
 
     args.operation = args.operation.upper() # convert to uppercase
+    if args.operation in ("STORE", "APPEND") and not args.id:
+        parser.error(f"the --id argument is required for the {args.operation} operation")
+    if args.operation == "BWT" and args.checkpoints and (args.rle or args.external):
+        parser.error("the --checkpoints argument cannot be combined with --rle or --external")
 
     # Input validation. If successful, the parameter seq representing the sequence is returned. Otherwise, an error is generated and the program ends
-    host, port, header, seq = validation_client(args.host, args.port, args.file, args.operation)
+    host, port, header, seq = validation_client(args.host, args.port, args.file, args.operation, args.rle)
 
     try:
         # Create a socket for the client and connect to the server
@@ -97,8 +151,19 @@ def main():
         welcome = s.recv(1024).decode()
         logging.info(welcome)
 
-        # Send the operation and sequence to the server with the end delimiter
-        data = f"{args.operation}: {seq}\n"
+        # Send the operation (with the suffix array engine, the external mode and the RLBWT format, if selected) and sequence to the server with the end delimiter
+        request = args.operation
+        if args.sa_engine and args.operation in ("BWT", "COMPRESS", "MBWT", "STORE"):
+            request += f" engine={args.sa_engine}"
+        if args.operation in ("STORE", "APPEND"):
+            request += f" id={args.id}"
+        if args.external and args.operation == "BWT":
+            request += " mode=external"
+        if args.rle:
+            request += " format=rle"
+        if args.checkpoints and args.operation == "BWT":
+            request += f" checkpoints={args.checkpoints}"
+        data = f"{request}: {seq}\n"
         s.sendall(data.encode())
         logging.info("All data successfully sent to the server.")
 
@@ -108,6 +173,9 @@ def main():
         # Receive the converted sequence from the server
         while True:
             data = s.recv(1024)
+            if not data:
+                # The server closed the connection without sending the whole result (e.g. after an error)
+                raise ConnectionResetError("Connection closed by the server before the result was received.")
             if end in data:
                 raw_seq += data[:data.find(end)]
                 logging.info("All data successfully received from the server.")
@@ -115,6 +183,10 @@ def main():
             raw_seq += data
         
         seq = raw_seq.decode()      # Decode the received data
+        if seq.startswith("ERROR: "):
+            # The server could not complete the request (e.g. APPEND to an unknown identifier)
+            logging.error(f"SERVER ERROR: {seq[len('ERROR: '):]}")
+            sys.exit(11)
    
     except socket.timeout:
         logging.error("SOCKET TIMEOUT ERROR: Connection timed out during data transmission.")
@@ -149,9 +221,11 @@ def main():
         # Generate the output file name
         output_file = f"{file_name}_{args.operation.lower()}_{timestamp}_output.txt"
         
-        # Write the operation performed and the converted sequence to an output file
+        # Write the operation performed and the converted sequence to an output file. STORE and APPEND return the BWT 
+        # of the reversed stored sequence, which is labelled as such.
+        label = "Output sequence (BWT of the reversed stored sequence)" if args.operation.upper() in ("STORE", "APPEND") else "Output sequence"
         with open(output_file, "w") as f:
-            f.write(f"{header}\nOperation performed: {args.operation}\n\nOutput sequence: {seq}")
+            f.write(f"{header}\nOperation performed: {args.operation}\n\n{label}: {seq}")
         logging.info(f"File {output_file} created and compiled.")
 
     except OSError as e:
@@ -1,77 +1,244 @@
+import os
+import fcntl
+import heapq
+import bisect
+import tempfile
+import multiprocessing
+import multiprocessing.pool
+import threading
 import numpy as np
-from collections import defaultdict, deque
+
+
+# Functions for the sequence encoding
+
+# Alphabet of the sequences: the "$" terminator followed by the 16 IUPAC nucleotide symbols. The symbols are in 
+# lexicographic order, so that their codes (the positions in the alphabet) preserve the order of the characters.
+ALPHABET = b"$ABCDGHKMNRSTUVWY"
+
+# Lookup tables to convert the bytes of a sequence into uint8 codes and back. Bytes that are not in the 
+# alphabet are mapped to INVALID_CODE.
+INVALID_CODE = 255
+ENCODE_TABLE = np.full(256, INVALID_CODE, dtype=np.uint8)
+ENCODE_TABLE[np.frombuffer(ALPHABET, dtype=np.uint8)] = np.arange(len(ALPHABET))
+DECODE_TABLE = np.frombuffer(ALPHABET, dtype=np.uint8)
+
+
+def encode_sequence(seq):
+    """
+    Function to convert the received sequence (str or bytes) into an array of uint8 codes through ENCODE_TABLE. 
+    Arrays are returned unchanged, so that the other functions can receive either a sequence or its codes.
+    """
+
+    if isinstance(seq, np.ndarray):
+        return seq
+    if isinstance(seq, str):
+        seq = seq.encode()
+
+    # Look up the code of each byte directly, without building a list of characters.
+    codes = ENCODE_TABLE[np.frombuffer(seq, dtype=np.uint8)]
+    if np.any(codes == INVALID_CODE):
+        raise ValueError("The sequence contains invalid symbols.")
+    return codes
+
+
+def decode_bytes(codes):
+    """
+    Function to convert an array of codes back into the corresponding sequence (bytes) through DECODE_TABLE, 
+    with a single gather.
+    """
+    return DECODE_TABLE[codes].tobytes()
+
+
+def decode_sequence(codes):
+    """
+    Function to convert an array of codes back into the corresponding sequence (str) through DECODE_TABLE.
+    """
+    return decode_bytes(codes).decode()
+
+
+
+
+# Functions for the reusable workspace
+
+# Workspace of the current process (and thread): named buffers reused by the conversion functions across requests 
+# and doubling rounds, to avoid repeated large allocations. Each buffer only grows.
+WORKSPACE = threading.local()
+
+
+def workspace_buffer(name, length, dtype):
+    """
+    Function to return a buffer of the workspace with the received name, as an array of the received length and dtype. 
+    The buffer is allocated on first use and reallocated (at least 1.5 times larger) only when it is too small or its 
+    dtype changes. Its content is not initialized, and it is overwritten by the next call with the same name.
+    """
+    buffers = WORKSPACE.__dict__.setdefault("buffers", {})
+    buffer = buffers.get(name)
+    if buffer is None or buffer.dtype != dtype or len(buffer) < length:
+        capacity = length if buffer is None or buffer.dtype != dtype else max(length, int(len(buffer) * 1.5))
+        buffer = buffers[name] = np.empty(capacity, dtype=dtype)
+    return buffer[:length]
+
+
+def reserve_workspace(length):
+    """
+    Function to preallocate the buffers of the workspace used by the vectorized engine for sequences up to the received 
+    length. It is used as the initializer of the server workers, so that the first requests find the buffers ready.
+    """
+    for name, dtype in [("kmer_keys", np.uint64), ("kmer_shift", np.uint64), ("sorted_keys", np.uint64), ("suffix_keys", np.uint64), 
+                        ("ranks", index_dtype(length)), ("active_suffixes", index_dtype(length)), ("sorted_suffixes", index_dtype(length)),
+                        ("group_ranks", index_dtype(length)), ("next_ranks", index_dtype(length)), ("shifted", index_dtype(length)), 
+                        ("boundaries", bool), ("resolved", bool)]:
+        workspace_buffer(name, length + 1, dtype)
+
+
 
 
 # Functions for BWT transformation
 
-def calculate_ranks(suffix_array, k, ranks):
+def index_dtype(n):
+    """
+    Function to return the integer dtype used for the indices (suffix array, ranks, LF mapping) of a sequence of n 
+    characters: uint32 below 2**32 characters, which halves the memory and the memory bandwidth of these arrays, 
+    int64 otherwise.
+    """
+    return np.uint32 if n < 2**32 else np.int64
+
+
+def cyclic_shift(positions, k, n, out=None):
+    """
+    Function to return the positions k characters ahead of the received positions (0 <= k < n), restarting 
+    from the beginning of the string if its end is reached. Unlike (positions + k) % n, it keeps the dtype of 
+    the positions without overflowing the unsigned ones. The result is written in out, if received.
+    """
+    if out is None:
+        out = np.empty_like(positions)
+    np.subtract(positions, n - k, out=out)
+    np.add(positions, k, out=out, where=positions < n - k)
+    return out
+
+
+def pack_rank_pairs(rank1, rank2, out=None):
+    """
+    Function to support the build_suffix_array functions. It packs each pair of ranks into a single uint64 key, 
+    with rank1 in the high 32 bits and rank2 in the low 32 bits, so that the pairs can be sorted and compared 
+    as single values. The ranks must be smaller than 2**32. The keys are written in out, if received.
+    """
+    if out is None:
+        out = np.empty(len(rank1), dtype=np.uint64)
+    out[:] = rank1
+    out <<= np.uint64(32)
+    np.bitwise_or(out, rank2, out=out, dtype=np.uint64, casting='unsafe')
+    return out
+
+
+def check_rank_pairs_length(n):
     """
-    Function to support the build_suffix_array function. It returns the next_ranks array with the ranks  
-    of the suffixes recalculated based on the first k characters.
+    Function to support the prefix doubling engines, which pack the rank pairs with pack_rank_pairs. It raises 
+    a ValueError for sequences of 2**32 characters or more, whose ranks would overflow the 32 bits of the keys.
     """
+    if n >= 2**32:
+        raise ValueError("The prefix doubling engines support sequences shorter than 2^32 characters.")
 
-    # Create the array of rank tuples. Each tuple represents a suffix and contains the suffix current rank (startin at position i) and 
-    # its rank k positions ahead, allowing to restart the string if its end is reached.
-    suffix_ranks = np.array([(ranks[i], ranks[(i + k) % len(ranks)]) for i in suffix_array], dtype=[('rank1', int), ('rank2', int)])
 
-    # Sort the suffixes based on the tuples in suffix_ranks with a stable kind to preserve the relative order 
-    # of suffix indices with equal tuples.
-    sorted_indices = np.argsort(suffix_ranks, order=['rank1', 'rank2'], kind='mergesort')
+def calculate_ranks(suffix_array, sorted_keys):
+    """
+    Function to support the build_suffix_array function. It receives the suffix array sorted by the rank pair keys 
+    of the current round together with the sorted keys, and returns the next_ranks array with the ranks of the 
+    suffixes recalculated based on those keys.
+    """
 
     # Create the next_ranks array for storing the updated ranks.
-    next_ranks = np.zeros(len(ranks), dtype=int)
+    next_ranks = np.zeros(len(suffix_array), dtype=index_dtype(len(suffix_array)))
 
-    # The loop iterates through the sorted suffix indices, starting from the second one (the first has rank = 0), and compares each suffix tuple
+    # The loop iterates through the sorted suffix indices, starting from the second one (the first has rank = 0), and compares each suffix key
     # with the previous one to increment the rank by 1 if they differ. Otherwise, assign the same rank as the previous suffix.
-    for i in range(1, len(ranks)):
-        if suffix_ranks[sorted_indices[i]] != suffix_ranks[sorted_indices[i - 1]]:
-            next_ranks[suffix_array[sorted_indices[i]]] = next_ranks[suffix_array[sorted_indices[i - 1]]] + 1
+    for i in range(1, len(suffix_array)):
+        if sorted_keys[i] != sorted_keys[i - 1]:
+            next_ranks[suffix_array[i]] = next_ranks[suffix_array[i - 1]] + 1
         else:
-            next_ranks[suffix_array[sorted_indices[i]]] = next_ranks[suffix_array[sorted_indices[i - 1]]]
+            next_ranks[suffix_array[i]] = next_ranks[suffix_array[i - 1]]
 
     return next_ranks
 
 
+def kmer_keys(seq_array):
+    """
+    Function to support the build_suffix_array functions. It packs the first k characters of each suffix into a uint64 
+    key, with k as large as possible, and returns the keys, k and the number of bits of each character. The keys are 
+    a buffer of the workspace, valid until the next call.
+    """
+
+    n = len(seq_array)
+
+    # Remap the codes to the symbols actually present (0, 1, 2, ...), so that each symbol takes as few bits as possible 
+    # (e.g. 3 bits for a DNA sequence with the terminator, 4 bits for the whole IUPAC alphabet).
+    present = np.bincount(seq_array) > 0
+    keys = np.take((np.cumsum(present) - 1).astype(np.uint64), seq_array, out=workspace_buffer("kmer_keys", n, np.uint64))
+    shifted = workspace_buffer("kmer_shift", n, np.uint64)
+    bits = max(1, (int(present.sum()) - 1).bit_length())
+
+    # Build the keys of the k-mers by doubling: the key of a 2k-mer is the key of its first k-mer followed by the key 
+    # of the k-mer k positions ahead (restarting from the beginning of the string if its end is reached). 
+    # k grows as long as the 2k-mers fit in 64 bits.
+    k = 1
+    while 2 * k * bits <= 64 and k < n:
+        shifted[:n - k], shifted[n - k:] = keys[k:], keys[:k]
+        keys <<= np.uint64(k * bits)
+        keys |= shifted
+        k *= 2
+
+    return keys, k, bits
+
+
+def kmer_ranks(seq_array, out=None):
+    """
+    Function to support the build_suffix_array functions. It ranks the suffixes by their first k characters with a 
+    single sort, packing each k-mer into a uint64 key, and returns the sorted suffix array, the ranks and k. 
+    The ranks are written in out, if received.
+    """
+
+    n = len(seq_array)
+    keys, k, _ = kmer_keys(seq_array)
+
+    # Sort the suffixes by their keys ("stable" to maintain the relative order of suffixes with the same key) 
+    # and assign the same rank to the suffixes with the same k-mer.
+    suffix_array = np.argsort(keys, kind='stable').astype(index_dtype(n))
+    sorted_keys = np.take(keys, suffix_array, out=workspace_buffer("sorted_keys", n, np.uint64))
+    ranks = np.empty(n, dtype=index_dtype(n)) if out is None else out
+    ranks[suffix_array] = np.concatenate(([0], np.cumsum(sorted_keys[1:] != sorted_keys[:-1])))
+
+    return suffix_array, ranks, k
+
+
 def build_suffix_array(seq):
     """
     Function to build and return the suffix array for the received sequence.
     """
 
-    # Convert to a numpy array
-    seq_array = np.array(list(seq))
+    # Convert to an array of codes
+    seq_array = encode_sequence(seq)
+    check_rank_pairs_length(len(seq_array))
 
-    # Create the initial suffix array sorting the starting indices of the suffixes of "seq" based on lexicographic order. 
-    # "mergesort" is used to maintain the correct relative order in case of suffixes with the same rank.
-    suffix_array = np.argsort(seq_array, kind='mergesort')
-    
-    # Initialize the ranks array. 
-    ranks = np.zeros(len(seq), dtype=int)
-    
-    # The loop iterates through the sorted suffix indices, starting from the second one (the first has rank = 0), and compares each suffix tuple
-    # with the previous one to increment the rank by 1 if they differ. Otherwise, assign the same rank as the previous suffix.
-    #  In this part, we are assigning the same initial rank to the suffixes that start with the same character.
-    for i in range(1, len(seq)):
-        if seq_array[suffix_array[i]] != seq_array[suffix_array[i - 1]]:
-            ranks[suffix_array[i]] = ranks[suffix_array[i - 1]] + 1
-        else:
-            ranks[suffix_array[i]] = ranks[suffix_array[i - 1]]
-    
+    # Create the initial suffix array sorting the starting indices of the suffixes of "seq" based on lexicographic order, 
+    # and the initial ranks. The kmer_ranks function compares the first k characters of the suffixes at once, so that 
+    # the first rounds of the loop below are skipped.
+    suffix_array, ranks, k = kmer_ranks(seq_array)
 
     # In each iteration, compare the suffixes using their ranks through the calculate_ranks function. 
-    k = 1
     while k < len(seq):
         
-        # Create the array of rank tuples. Each tuple represents a suffix and contains the suffix current rank and its rank k positions ahead.
-        suffix_ranks = np.array([(ranks[i], ranks[(i + k) % len(seq)]) for i in suffix_array], dtype=[('rank1', int), ('rank2', int)])
+        # Create the array of rank pair keys. Each key represents a suffix and contains the suffix current rank and its rank k positions ahead, 
+        # allowing to restart the string if its end is reached.
+        suffix_keys = pack_rank_pairs(ranks[suffix_array], ranks[cyclic_shift(suffix_array, k, len(seq))])
 
-        # Sort the rank tuples ("mergesort" as before).
-        sorted_indices = np.argsort(suffix_ranks, order=['rank1', 'rank2'], kind='mergesort')
+        # Sort the keys ("mergesort" as before). This is the only sort of the round.
+        sorted_indices = np.argsort(suffix_keys, kind='mergesort')
 
         # Reorder the suffix array based on the new indices.
         suffix_array = suffix_array[sorted_indices]
         
-        # Update the ranks based on the new sorted suffix array using the calculate_ranks function.
-        ranks = calculate_ranks(suffix_array, k, ranks)
+        # Update the ranks based on the new sorted suffix array and the sorted keys using the calculate_ranks function.
+        ranks = calculate_ranks(suffix_array, suffix_keys[sorted_indices])
         
         # Double k to compare larger portions of the suffixes in the next iteration. 
         k *= 2
@@ -83,97 +250,2074 @@ def build_suffix_array(seq):
     return suffix_array
 
 
-def burrows_wheeler_conversion(seq):
+def build_suffix_array_vectorized(seq):
     """
-    Function to convert and return the received sequence in the BWT format using the suffix array.
+    Function to build and return the suffix array for the received sequence using only NumPy array operations. 
+    It follows the same prefix doubling strategy of build_suffix_array, but the rank tuples are built by gathering 
+    from the ranks array, and the new ranks are assigned by comparing neighbouring tuples. As in the Larsson-Sadakane 
+    algorithm, each round only re-sorts the groups of suffixes that still share the same rank. The intermediate 
+    arrays are buffers of the workspace, reused across the rounds and the requests.
     """
 
-    # Append the character "$" to the string to mark the end. This symbol is lexicographically smaller
-    # than all the other characters. 
-    seq += "$"
+    # Convert to an array of codes
+    seq_array = encode_sequence(seq)
+    n = len(seq_array)
+    check_rank_pairs_length(n)
+    dtype = index_dtype(n)
 
-    # Build the suffix array of the sequence using the build_suffix_array function.
-    suffix_array = build_suffix_array(seq)
+    # Create the initial suffix array and ranks by sorting the suffixes by their first k characters.
+    suffix_array, ranks, k = kmer_ranks(seq_array, out=workspace_buffer("ranks", n, dtype))
 
-    # Convert to a numpy array.
-    seq_array = np.array(list(seq))
+    # The rank of each suffix becomes the position in the suffix array where its group (the suffixes with the same rank) starts. 
+    # This keeps the order of the ranks, and allows to update the ranks of some groups without renumbering the others.
+    sorted_ranks = np.take(ranks, suffix_array, out=workspace_buffer("group_ranks", n, dtype))
+    boundaries = workspace_buffer("boundaries", n + 1, bool)
+    boundaries[0] = boundaries[n] = True
+    np.not_equal(sorted_ranks[1:], sorted_ranks[:-1], out=boundaries[1:n])
+    group_starts = np.multiply(np.arange(n, dtype=dtype), boundaries[:n], out=workspace_buffer("next_ranks", n, dtype))
+    ranks[suffix_array] = np.maximum.accumulate(group_starts, out=group_starts)
 
-    # Create the BWT result to store the result of the conversion based on the suffix array. 
-    # For each index i in the suffix array, append the character at i-1 in the original sequence.
-    bwt_result = ''.join(seq_array[(i - 1) % len(seq)] for i in suffix_array)
+    # Positions of the suffix array whose group is still unresolved (more than one suffix). A position is resolved 
+    # when both itself and the next position start a group.
+    active = np.flatnonzero(~(boundaries[:n] & boundaries[1:])).astype(dtype)
 
-    # Join into a single string and return the final BWT.
-    return bwt_result
+    while k < n and len(active) > 0:
+        m = len(active)
 
+        # Gather the rank pairs of the unresolved suffixes only: the current rank and the rank k positions ahead, 
+        # restarting from the beginning of the string if its end is reached.
+        # Each pair is packed into a single key.
+        active_suffixes = np.take(suffix_array, active, out=workspace_buffer("active_suffixes", m, dtype))
+        group_ranks = np.take(ranks, active_suffixes, out=workspace_buffer("group_ranks", m, dtype))
+        shifted = cyclic_shift(active_suffixes, k, n, out=workspace_buffer("shifted", m, dtype))
+        next_ranks = np.take(ranks, shifted, out=workspace_buffer("next_ranks", m, dtype))
+        suffix_keys = pack_rank_pairs(group_ranks, next_ranks, out=workspace_buffer("suffix_keys", m, np.uint64))
 
+        # Sort the keys with a stable sort. Since rank1 is the start of the group, each group is sorted within 
+        # the positions it already occupies in the suffix array.
+        sorted_indices = np.argsort(suffix_keys, kind='stable')
+        sorted_suffixes = np.take(active_suffixes, sorted_indices, out=workspace_buffer("sorted_suffixes", m, dtype))
+        suffix_array[active] = sorted_suffixes
+        sorted_keys = np.take(suffix_keys, sorted_indices, out=workspace_buffer("sorted_keys", m, np.uint64))
 
+        # A new group starts wherever a key differs from the previous one: its rank is the position where it starts.
+        boundaries = workspace_buffer("boundaries", m + 1, bool)
+        boundaries[0] = boundaries[m] = True
+        np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=boundaries[1:m])
+        group_starts = np.multiply(active, boundaries[:m], out=workspace_buffer("next_ranks", m, dtype))
+        ranks[sorted_suffixes] = np.maximum.accumulate(group_starts, out=group_starts)
 
-# Functions for BWT reversion
+        # Keep only the positions whose group is still unresolved for the next round.
+        resolved = np.logical_and(boundaries[:m], boundaries[1:], out=workspace_buffer("resolved", m, bool))
+        active = active[~resolved]
 
-def map_last_to_first(bwt):
+        # Double k to compare larger portions of the suffixes in the next iteration.
+        k *= 2
+
+    return suffix_array
+
+
+# Shared arrays of the parallel engine, set in each worker by the attach_shared_arrays function.
+SHARED_ARRAYS = {}
+
+
+def attach_shared_arrays(keys_buffer, suffixes_buffer, suffixes_dtype):
     """
-    Function that implements LF mapping:
-        - Takes the bwt string (last column) as input.
-        - Constructs the first column (the bwt string sorted lexicographically).
-        - Determines the rank of each character in the last column.
-        - Calculates the corresponding position of the character in the first column.
-        - Returns the final array with the indexes.
+    Function to initialize the workers of the parallel engine. It wraps the shared memory buffers of the keys and 
+    of the suffixes to sort into NumPy arrays, without copying them.
     """
-    
-    # Convert to a numpy array.
-    bwt_array = np.array(list(bwt))  
+    SHARED_ARRAYS["keys"] = np.frombuffer(keys_buffer, dtype=np.uint64)
+    SHARED_ARRAYS["suffixes"] = np.frombuffer(suffixes_buffer, dtype=suffixes_dtype)
 
-    # Sort the bwt string lexicographically to create the first column.
-    first_col = np.sort(bwt_array)
 
-    # Create an array to store the indices mapping from the last column to the first column.
-    last_to_first = np.zeros(len(bwt), dtype=int)
+def sort_segments(segments):
+    """
+    Function to support the build_suffix_array_parallel function. It sorts each received segment (start, end) of the 
+    shared keys, together with the shared suffixes, in place. The segments of different workers do not overlap.
+    """
+    keys, suffixes = SHARED_ARRAYS["keys"], SHARED_ARRAYS["suffixes"]
+    for start, end in segments:
+        sorted_indices = np.argsort(keys[start:end], kind='stable')
+        keys[start:end] = keys[start:end][sorted_indices]
+        suffixes[start:end] = suffixes[start:end][sorted_indices]
 
-    # Dictionary to store the first occurrence of each character present in the sorted first column.
-    first = {}
-    for i, char in enumerate(first_col):
-        if char not in first:
-            first[char] = i
 
-    # Dictionary to store how many times each character is encountered (the rank).
-    char_counts = defaultdict(int)  
-    
-    # For each character in the last column, determine its index in the first column by summing the index of its first occurrence in the first column  
-    # with its rank (the number of occurrences so far in the last column). Then, store it in the last_to_first array.
-    for i, char in enumerate(bwt_array):
-        first_col_index = first[char] + char_counts[char]      # Find the index in the first column.
-        last_to_first[i] = first_col_index      # Store the index.
-        char_counts[char] += 1      # Increment the count for the found character.
+def split_segments(cuts, length, n_segments):
+    """
+    Function to support the build_suffix_array_parallel function. It splits the range [0, length) into about n_segments 
+    segments of similar size, cutting only at the received positions (the starts of the buckets or groups).
+    """
+    targets = np.linspace(0, length, n_segments + 1)[1:-1]
+    cuts = np.unique(np.concatenate(([0], cuts[np.minimum(np.searchsorted(cuts, targets), len(cuts) - 1)], [length]))) if len(cuts) else np.array([0, length])
+    return [(int(start), int(end)) for start, end in zip(cuts[:-1], cuts[1:]) if end > start]
 
-    return last_to_first
 
+def build_suffix_array_parallel(seq, n_workers=None, prefix_bits=16):
+    """
+    Function to build and return the suffix array for the received sequence using several processes (n_workers, the 
+    number of CPU cores by default). It follows the strategy of build_suffix_array_vectorized, but the sorts are split 
+    into independent segments sorted in parallel on shared memory: first the buckets of the suffixes sharing the same 
+    leading characters (prefix_bits bits of their k-mer key, at most 16), then the unresolved groups of each round.
+    """
+
+    # Convert to an array of codes
+    seq_array = encode_sequence(seq)
+    n = len(seq_array)
+    check_rank_pairs_length(n)
+    n_workers = n_workers or multiprocessing.cpu_count()
+    if n_workers == 1 or n < 2**16:
+        return build_suffix_array_vectorized(seq_array)
+
+    # Shared memory for the keys and the suffixes to sort, and the workers attached to it. The daemonic processes 
+    # (e.g. the workers of a multiprocessing.Pool) cannot create other processes, so they use threads (NumPy releases 
+    # the GIL while sorting).
+    suffixes_dtype = index_dtype(n)
+    keys_buffer = multiprocessing.RawArray('Q', n)
+    suffixes_buffer = multiprocessing.RawArray('I' if suffixes_dtype == np.uint32 else 'q', n)
+    keys, suffixes = np.frombuffer(keys_buffer, dtype=np.uint64), np.frombuffer(suffixes_buffer, dtype=suffixes_dtype)
+    pool_class = multiprocessing.pool.ThreadPool if multiprocessing.current_process().daemon else multiprocessing.Pool
+    n_segments = 4 * n_workers      # More segments than workers, to balance the load
+
+    with pool_class(n_workers, initializer=attach_shared_arrays, initargs=(keys_buffer, suffixes_buffer, suffixes_dtype)) as pool:
+
+        # Distribute the suffixes into buckets by their leading characters (the top prefix_bits bits of the k-mer keys, 
+        # stored as uint16 so that the stable sort is a radix sort instead of a serial merge sort of int64 keys) and 
+        # sort the buckets in parallel by their whole k-mer keys.
+        kmers, k, bits = kmer_keys(seq_array)
+        shift = max(0, k * bits - min(prefix_bits, 16))
+        buckets = (kmers >> np.uint64(shift)).astype(np.uint16)
+        suffixes[:] = np.argsort(buckets, kind='stable')
+        keys[:] = kmers[suffixes]
+        bucket_starts = np.cumsum(np.bincount(buckets))[:-1]
+        pool.map(sort_segments, np.array_split(split_segments(bucket_starts, n, n_segments), n_workers))
+        suffix_array = suffixes.copy()
+
+        # As in build_suffix_array_vectorized, the rank of each suffix is the position where its group starts.
+        boundaries = np.concatenate(([True], keys[1:] != keys[:-1]))
+        ranks = np.empty(n, dtype=suffixes_dtype)
+        ranks[suffix_array] = np.maximum.accumulate(np.where(boundaries, np.arange(n), 0))
+        active = np.flatnonzero(~(boundaries & np.append(boundaries[1:], True))).astype(suffixes_dtype)
+
+        while k < n and len(active) > 0:
+
+            # Gather the rank pairs of the unresolved suffixes into the shared memory, and sort the groups in parallel. 
+            # Each segment contains whole groups, since it is cut where rank1 (the start of the group) changes.
+            m = len(active)
+            active_suffixes = suffix_array[active]
+            group_ranks = ranks[active_suffixes]
+            suffixes[:m] = active_suffixes
+            keys[:m] = pack_rank_pairs(group_ranks, ranks[cyclic_shift(active_suffixes, k, n)])
+            group_starts = np.flatnonzero(group_ranks[1:] != group_ranks[:-1]) + 1
+            pool.map(sort_segments, np.array_split(split_segments(group_starts, m, n_segments), n_workers))
+            suffix_array[active] = suffixes[:m]
 
-def revert_burrows_wheeler(bwt):
+            # A new group starts wherever a key differs from the previous one: its rank is the position where it starts.
+            boundaries = np.concatenate(([True], keys[1:m] != keys[:m - 1]))
+            ranks[suffixes[:m]] = np.maximum.accumulate(np.where(boundaries, active, 0))
+
+            # Keep only the positions whose group is still unresolved for the next round.
+            active = active[~(boundaries & np.append(boundaries[1:], True))]
+            k *= 2
+
+    return suffix_array
+
+
+def induce_sort(text, is_s, sorted_lms, bucket_starts, bucket_ends, suffix_array):
     """
-    Function to reverse the bwt string and return the original sequence.
+    Function to support the build_suffix_array_sais function. Starting from the LMS suffixes placed at the end of 
+    their buckets, it induces the order of the L-type suffixes with a left-to-right scan and then the order of 
+    the S-type suffixes with a right-to-left scan. The result is written in the received suffix_array buffer, 
+    which is also returned.
     """
-    # This line calls the map_last_to_first function to store the positions of the characters present
-    # in the bwt string mapped in the sorted bwt string (first column).
-    last_to_first = map_last_to_first(bwt)
 
-    # Convert to a numpy array.
-    bwt_array = np.array(list(bwt))
-    
-    # Get the index of the terminator character.
-    idx = np.where(bwt_array == '$')[0][0]
+    n = len(text)
+    suffix_array.fill(-1)
 
-    # Variable to store the reconstructed sequence. A deque is used to more efficiently prepend 
-    # the characters.
-    original_seq = deque()
+    # Memoryviews are used inside the loops since indexing them is much faster than indexing numpy arrays 
+    # (and, unlike tolist, they do not create a Python integer for each element in advance). The bucket pointers 
+    # are Python lists, which are faster to update, unless there are many buckets (in the recursive calls).
+    sa, t, s_type, lms = memoryview(suffix_array), memoryview(text), memoryview(is_s), memoryview(sorted_lms)
+    pointers = (lambda buckets: buckets.tolist()) if len(bucket_ends) <= 2**16 else (lambda buckets: memoryview(buckets.copy()))
 
-    # The loop iterates for the length of the bwt string, prepending the characters to "original_seq" 
-    # in reverse order using the last_to_first mapping.    
-    for _ in range(len(bwt)):
-        char = bwt_array[idx]      # Get the character at index "idx" in the bwt string
-        original_seq.appendleft(char)      # Append the character to the front of "original_seq".
-        idx = last_to_first[idx]      # Update idx 
+    # Place the LMS suffixes at the end of their buckets, keeping their relative order.
+    tails = pointers(bucket_ends)
+    for i in range(len(lms) - 1, -1, -1):
+        pos = lms[i]
+        tails[t[pos]] -= 1
+        sa[tails[t[pos]]] = pos
+
+    # Left-to-right scan: the L-type suffix preceding each placed suffix is put at the head of its bucket.
+    heads = pointers(bucket_starts)
+    for i in range(n):
+        j = sa[i] - 1
+        if j >= 0 and not s_type[j]:
+            sa[heads[t[j]]] = j
+            heads[t[j]] += 1
+
+    # Right-to-left scan: the S-type suffix preceding each placed suffix is put at the tail of its bucket.
+    tails = pointers(bucket_ends)
+    for i in range(n - 1, -1, -1):
+        j = sa[i] - 1
+        if j >= 0 and s_type[j]:
+            tails[t[j]] -= 1
+            sa[tails[t[j]]] = j
+
+    return suffix_array
+
+
+def take_in_blocks(values, indices, block_size=2**18):
+    """
+    Function to support the sais function. It returns values[indices], gathered in blocks of block_size indices, 
+    since NumPy converts the whole array of indices to 64-bit integers before indexing.
+    """
+    result = np.empty(len(indices), dtype=values.dtype)
+    for start in range(0, len(indices), block_size):
+        result[start:start + block_size] = values[indices[start:start + block_size]]
+    return result
+
+
+def sais(text, alphabet_size):
+    """
+    Function to support the build_suffix_array_sais function. It implements the SA-IS algorithm on an integer text
+    whose last element is a unique sentinel smaller than all the other symbols, and returns its suffix array. 
+    Besides the text, it keeps a single suffix array buffer (int32 below 2**31 symbols), the types of the suffixes 
+    and the LMS positions: the names of the LMS substrings are stored in the unused half of the buffer, which is 
+    reused by the second induced sort.
+    """
+
+    n = len(text)
+    dtype = np.int32 if n < 2**31 else np.int64
+    if n == 1:
+        return np.zeros(1, dtype=dtype)
+
+    # Classify each suffix as S-type (smaller than the following suffix) or L-type (larger). A suffix starting with 
+    # the same character as the following one shares its type, so the type of the closest different pair of 
+    # characters on the right is propagated. The sentinel is S-type by definition.
+    diff = np.ones(n, dtype=np.int8)
+    diff[:-1] = text[1:] > text[:-1]
+    diff[:-1] -= text[1:] < text[:-1]
+    decided = np.where(diff != 0, np.arange(n, dtype=dtype), n - 1)
+    np.minimum.accumulate(decided[::-1], out=decided[::-1])
+    is_s = take_in_blocks(diff, decided) > 0
+    del diff, decided
+
+    # Find the LMS (leftmost S-type) positions: S-type suffixes preceded by an L-type suffix.
+    lms = (np.flatnonzero(is_s[1:] & ~is_s[:-1]) + 1).astype(dtype)
+    n_lms = len(lms)
+
+    # Compute the start and the end of the bucket of each symbol. The symbols are counted in blocks, since 
+    # np.bincount converts its input to 64-bit integers.
+    block_size = max(2**18, alphabet_size)
+    counts = np.zeros(alphabet_size, dtype=np.int64)
+    for start in range(0, n, block_size):
+        counts += np.bincount(text[start:start + block_size], minlength=alphabet_size)
+    bucket_ends = np.cumsum(counts).astype(dtype)
+    bucket_starts = bucket_ends - counts.astype(dtype)
+
+    # First induced sort: starting from the LMS suffixes in text order, it sorts the LMS substrings. 
+    # The sorted LMS positions are then moved to the first n_lms slots of the buffer.
+    suffix_array = induce_sort(text, is_s, lms, bucket_starts, bucket_ends, np.empty(n, dtype=dtype))
+    is_lms = np.zeros(n, dtype=bool)
+    is_lms[lms] = True
+    suffix_array[:n_lms] = suffix_array[take_in_blocks(is_lms, suffix_array)]
+    del is_lms
+
+    # Name the LMS substrings: the name is incremented every time a substring differs from the previous one. 
+    # An LMS substring goes from its LMS position to the next one (included). Two LMS positions are never adjacent, 
+    # so the slot n_lms + pos // 2 of the buffer is free and distinct for each of them: it first holds the length 
+    # of the substring starting at pos, and then its name.
+    suffix_array[n_lms:] = -1
+    suffix_array[n_lms + lms // 2] = np.diff(lms, append=n - 1)
+    sa, t = memoryview(suffix_array), memoryview(text)
+    name = 0
+    prev = sa[0]
+    prev_length = sa[n_lms + prev // 2]
+    sa[n_lms + prev // 2] = 0
+    for i in range(1, n_lms):
+        pos = sa[i]
+        length = sa[n_lms + pos // 2]
+        if length != prev_length or t[pos:pos + length + 1] != t[prev:prev + prev_length + 1]:
+            name += 1
+        sa[n_lms + pos // 2] = name
+        prev, prev_length = pos, length
+
+    # Build the reduced string of the names in text order (the slots of the names follow the order of the positions). 
+    # If all the names are distinct the order of the LMS suffixes is already known, otherwise it is found recursively.
+    names = suffix_array[n_lms:]
+    reduced = names[names >= 0]
+    if name + 1 == n_lms:
+        reduced_sa = np.empty(n_lms, dtype=dtype)
+        reduced_sa[reduced] = np.arange(n_lms, dtype=dtype)
+    else:
+        reduced_sa = sais(reduced, name + 1)
+    del reduced, names
+
+    # Second induced sort: starting from the correctly sorted LMS suffixes, it sorts all the suffixes, reusing the buffer.
+    return induce_sort(text, is_s, lms[reduced_sa], bucket_starts, bucket_ends, suffix_array)
+
+
+def build_suffix_array_sais(seq):
+    """
+    Function to build and return the suffix array for the received sequence in linear time using SA-IS 
+    (induced sorting).
+    """
+
+    # Convert to an array of codes shifted by 1, then append a virtual sentinel (0) that is smaller than all the other codes. 
+    # The codes of a sequence fit in one byte, while the integer texts of the collections may need a wider type.
+    seq_array = encode_sequence(seq)
+    n = len(seq_array)
+    text_dtype = np.uint8 if n == 0 or int(seq_array.max()) < 255 else (np.int32 if n < 2**31 else np.int64)
+    text = np.zeros(n + 1, dtype=text_dtype)
+    text[:-1] = seq_array
+    text[:-1] += 1
+
+    # The first suffix of the result is the virtual sentinel, which is removed. The signed indices used internally 
+    # (-1 marks the empty slots) are all non-negative at the end, so they are reinterpreted without a copy when the 
+    # index dtype of the sequence has the same size.
+    suffix_array = sais(text, int(text.max()) + 1)[1:]
+    dtype = index_dtype(n)
+    return suffix_array.view(dtype) if suffix_array.dtype.itemsize == np.dtype(dtype).itemsize else suffix_array.astype(dtype)
+
+
+def radix_pass(indices, keys):
+    """
+    Function to support the dc3 function. It returns the indices stably sorted by the corresponding keys.
+    """
+    return indices[np.argsort(keys, kind='stable')]
+
+
+def dc3(text, alphabet_size):
+    """
+    Function to support the build_suffix_array_dc3 function. It implements the DC3 (skew) algorithm on an integer 
+    text whose symbols are all greater than 0, and returns its suffix array. The positions, ranks and names use the 
+    index dtype of the text (uint32 below 2**32 characters) and the sort keys the narrowest type that holds them.
+    """
+
+    n = len(text)
+    dtype = index_dtype(n + 3)
+
+    # Very short texts are sorted directly.
+    if n <= 3:
+        return np.array(sorted(range(n), key=lambda i: text[i:].tolist()), dtype=dtype)
+
+    # Number of suffixes starting at positions i % 3 == 0, 1 and 2. The text is padded with zeros, which are 
+    # smaller than all the symbols, to always read three characters.
+    n0, n1, n2 = (n + 2) // 3, (n + 1) // 3, n // 3
+    n02 = n0 + n2
+    t = np.zeros(n + 3, dtype=dtype)
+    t[:n] = text
+
+    # The keys combine a character (or a pair of characters) with a rank below scale: they are kept in uint32 
+    # while they fit, which is always the case for the DNA alphabet up to tens of millions of bases.
+    scale = n02 + 2
+    n_pairs = min(alphabet_size ** 2, n)
+    pair_dtype = np.uint32 if alphabet_size ** 2 < 2**32 else np.uint64
+    key_dtype = np.uint32 if (max(alphabet_size, n_pairs) + 1) * scale < 2**32 else np.uint64
+
+    # Take the sample suffixes starting at positions i % 3 != 0. If n % 3 == 1, a dummy suffix starting at 
+    # position n is added so that the last mod 1 triple is always followed by a mod 2 one.
+    s12 = np.arange(n + n0 - n1, dtype=dtype)
+    s12 = s12[s12 % 3 != 0]
+
+    # Sort the sample suffixes by their first three characters with three radix passes.
+    for offset in (2, 1, 0):
+        s12 = radix_pass(s12, t[s12 + offset])
+
+    # Name the triples: the name is incremented every time a triple differs from the previous one.
+    boundaries = np.any(np.diff(np.stack((t[s12], t[s12 + 1], t[s12 + 2])), axis=1) != 0, axis=0)
+    names = np.ones(len(s12), dtype=dtype)
+    np.cumsum(boundaries, dtype=dtype, out=names[1:])
+    names[1:] += 1
+    del boundaries
+
+    # Build the reduced string with the names of the mod 1 suffixes followed by the names of the mod 2 ones. 
+    # If all the names are distinct, the order of the sample suffixes is already known, otherwise it is found recursively.
+    reduced = np.empty(n02, dtype=dtype)
+    reduced[np.where(s12 % 3 == 1, s12 // 3, s12 // 3 + n0)] = names
+    n_names = int(names[-1])
+    del names, s12
+    if n_names < n02:
+        reduced_sa = dc3(reduced, n_names + 1)
+    else:
+        reduced_sa = np.empty(n02, dtype=dtype)
+        reduced_sa[reduced - 1] = np.arange(n02, dtype=dtype)
+    del reduced
+
+    # Convert the reduced suffix array back to text positions and store the rank of each sample suffix 
+    # (positions beyond the end of the text keep rank 0).
+    sample = np.where(reduced_sa < n0, reduced_sa * 3 + 1, (reduced_sa - n0) * 3 + 2)
+    del reduced_sa
+    rank = np.zeros(n + 3, dtype=dtype)
+    rank[sample] = np.arange(1, n02 + 1, dtype=dtype)
+
+    # Sort the mod 0 suffixes by their first character and the rank of the following sample suffix. The mod 1 
+    # suffixes are already sorted, so a single radix pass on the first character is needed.
+    s0 = sample[sample % 3 == 1] - 1
+    s0 = radix_pass(s0, t[s0])
+
+    # Merge the two sorted lists. The dummy suffix is removed from the sample suffixes. A mod 0 suffix is compared 
+    # with a mod 1 suffix through (first character, rank of the next suffix), and with a mod 2 suffix through 
+    # (first two characters, rank of the suffix two positions ahead): both keys are sample ranks for each side.
+    sample = sample[sample < n]
+    is_mod1 = sample % 3 == 1
+    s1, s2 = sample[is_mod1], sample[~is_mod1]
+    key0_1 = t[s0].astype(key_dtype) * scale + rank[s0 + 1]
+    key1 = t[s1].astype(key_dtype) * scale + rank[s1 + 1]
+    _, pairs = np.unique(np.concatenate((t[s0].astype(pair_dtype) * alphabet_size + t[s0 + 1], 
+                                         t[s2].astype(pair_dtype) * alphabet_size + t[s2 + 1])), return_inverse=True)
+    key0_2 = pairs[:n0].astype(key_dtype) * scale + rank[s0 + 2]
+    key2 = pairs[n0:].astype(key_dtype) * scale + rank[s2 + 2]
+    del pairs, rank, t
+
+    # The final position of each suffix is its position in its own list plus the number of smaller suffixes in the other lists.
+    suffix_array = np.empty(n, dtype=dtype)
+    suffix_array[np.arange(n0, dtype=dtype) + np.searchsorted(key1, key0_1).astype(dtype) + np.searchsorted(key2, key0_2).astype(dtype)] = s0
+    sample_positions = np.arange(len(sample), dtype=dtype)
+    suffix_array[sample_positions[is_mod1] + np.searchsorted(key0_1, key1)] = s1
+    suffix_array[sample_positions[~is_mod1] + np.searchsorted(key0_2, key2)] = s2
+
+    return suffix_array
+
+
+def build_suffix_array_dc3(seq):
+    """
+    Function to build and return the suffix array for the received sequence in linear time using DC3 
+    (difference cover modulo 3), which is built mostly from radix passes over integer arrays.
+    """
+
+    # Convert to an array of codes shifted by 1, so that all the symbols are greater than the padding (0).
+    seq_array = encode_sequence(seq)
+    text = seq_array.astype(index_dtype(len(seq_array) + 3)) + 1
+
+    return dc3(text, int(text.max()) + 1).astype(index_dtype(len(seq_array)), copy=False)
+
+
+# Registry of the suffix array construction engines that can be selected in the burrows_wheeler_conversion function.
+SA_ENGINES = {
+    "doubling": build_suffix_array,
+    "vectorized": build_suffix_array_vectorized,
+    "parallel": build_suffix_array_parallel,
+    "sais": build_suffix_array_sais,
+    "dc3": build_suffix_array_dc3,
+}
+
+
+# Default thresholds used by the select_sa_engine function:
+#   - small_length: below this length the doubling engine is used, since it has no setup overhead.
+#   - direct_length: from this length the BWT is built directly, without the suffix array, to save memory.
+#   - parallel_length: from this length the parallel engine is used on machines with several CPU cores.
+#   - large_length: from this length the linear-time engine is used.
+#   - min_kmer_diversity and max_run_length: a sequence with a lower k-mer diversity or a higher average run length 
+#     is considered repetitive, and the linear-time engine is used.
+#   - linear_engine: the linear-time engine to use (sais or dc3).
+ENGINE_THRESHOLDS = {
+    "small_length": 64,
+    "direct_length": 2**20,
+    "parallel_length": 2**22,
+    "large_length": 100_000_000,
+    "min_kmer_diversity": 0.5,
+    "max_run_length": 4.0,
+    "linear_engine": "sais",
+}
+
+
+def sequence_repetitiveness(seq_array, n_windows=16, window_length=4096, k=12):
+    """
+    Function to support the select_sa_engine function. It probes some windows evenly spaced along the sequence and 
+    returns two measures of its repetitiveness: the average length of the runs of equal symbols and the k-mer 
+    diversity (the fraction of distinct k-mers among the k-mers of the windows).
+    """
+
+    n = len(seq_array)
+    window_length = min(window_length, n)
+    n_windows = max(1, min(n_windows, n // window_length))
+    k = min(k, window_length)
+
+    # Extract the windows (without overlaps) as the rows of a 2D array.
+    starts = np.linspace(0, n - window_length, n_windows).astype(np.int64)
+    windows = seq_array[starts[:, None] + np.arange(window_length)].astype(np.uint64)
+
+    # Average run length: number of symbols divided by the number of runs (a run starts wherever a symbol differs from the previous one).
+    n_runs = n_windows + np.count_nonzero(windows[:, 1:] != windows[:, :-1])
+    run_length = float(windows.size / n_runs)
+
+    # Pack the k-mers of each window into uint64 keys (5 bits per symbol) and count the distinct ones.
+    kmers = np.zeros((n_windows, window_length - k + 1), dtype=np.uint64)
+    for j in range(k):
+        kmers = (kmers << np.uint64(5)) | windows[:, j:window_length - k + 1 + j]
+    kmer_diversity = len(np.unique(kmers)) / kmers.size
+
+    return run_length, kmer_diversity
+
+
+def select_sa_engine(seq, small_length=ENGINE_THRESHOLDS["small_length"], large_length=ENGINE_THRESHOLDS["large_length"],
+                     min_kmer_diversity=ENGINE_THRESHOLDS["min_kmer_diversity"], max_run_length=ENGINE_THRESHOLDS["max_run_length"],
+                     linear_engine=ENGINE_THRESHOLDS["linear_engine"], parallel_length=ENGINE_THRESHOLDS["parallel_length"],
+                     direct_length=ENGINE_THRESHOLDS["direct_length"]):
+    """
+    Function to select the suffix array engine for the received sequence based on its length and repetitiveness:
+        - Tiny sequences use the doubling engine, which avoids the setup overhead of the others.
+        - Huge or repetitive sequences use the linear-time engine, whose running time does not depend on the repeats.
+        - Large sequences use the parallel doubling engine, if several CPU cores are available, or otherwise the 
+          direct conversion ("direct"), which needs a few bytes per base instead of a full suffix array.
+        - All the other sequences use the vectorized doubling engine.
+    Returns the name of the engine in SA_ENGINES, or "direct".
+    """
+
+    seq_array = encode_sequence(seq)
+    n = len(seq_array)
+
+    if n < small_length:
+        return "doubling"
+    if n >= large_length:
+        return linear_engine
+
+    run_length, kmer_diversity = sequence_repetitiveness(seq_array)
+    if kmer_diversity < min_kmer_diversity or run_length > max_run_length:
+        return linear_engine
+    if n >= parallel_length and multiprocessing.cpu_count() > 1:
+        return "parallel"
+    if n >= direct_length:
+        return "direct"
+    return "vectorized"
+
+
+def burrows_wheeler_conversion(seq, engine="auto"):
+    """
+    Function to convert and return the received sequence in the BWT format (bytes) using the suffix array.
+    The engine used to build the suffix array can be selected among the ones in SA_ENGINES, or chosen 
+    by the select_sa_engine function ("auto"). With "direct", the BWT is built by the burrows_wheeler_direct 
+    function, without the suffix array.
+    """
+
+    if engine not in ("auto", "direct") and engine not in SA_ENGINES:
+        raise ValueError(f"Unknown suffix array engine: {engine}.")
+
+    # Convert to an array of codes and append the code of the character "$" to mark the end. This symbol is 
+    # lexicographically smaller than all the other characters.
+    seq_array = np.append(encode_sequence(seq), np.uint8(0))
+    if engine == "auto":
+        engine = select_sa_engine(seq_array)
+    if engine == "direct":
+        return burrows_wheeler_direct(seq_array[:-1])
+
+    # Build the suffix array of the sequence using the selected engine.
+    suffix_array = SA_ENGINES[engine](seq_array)
+
+    # Create the BWT result based on the suffix array with a single gather: for each index i in the suffix array, take 
+    # the code at i-1 in the original sequence (the codes rolled by one position, so that the unsigned indices never 
+    # go below 0). Then decode the codes straight into bytes, ready to be sent to the client.
+    bwt_result = np.roll(seq_array, 1)[suffix_array]
+    return decode_bytes(bwt_result)
+
+
+
+
+# Functions for the direct BWT transformation (without the suffix array)
+
+def rank_sorted_block(keys, suffixes, sa_positions, ranks, active, n_active, previous_key=None, previous_start=0, next_key=None):
+    """
+    Function to support the burrows_wheeler_direct function. It receives a block of suffixes sorted by their keys, 
+    with their positions in the suffix array, and assigns to each suffix the position where its group (the suffixes 
+    with the same key) starts. The suffixes of the groups with more than one suffix are appended to active. 
+    The key and the group start of the suffix before the block and the key of the suffix after the block (None if 
+    the block starts or ends a group) connect the groups split across blocks. It returns the new length of active.
+    """
+    boundaries = np.empty(len(keys) + 1, dtype=bool)
+    boundaries[0] = previous_key is None or keys[0] != previous_key
+    boundaries[1:-1] = keys[1:] != keys[:-1]
+    boundaries[-1] = next_key is None or keys[-1] != next_key
+    ranks[suffixes] = np.maximum.accumulate(np.where(boundaries[:-1], sa_positions, previous_start))
+    unresolved = suffixes[~(boundaries[:-1] & boundaries[1:])]
+    active[n_active:n_active + len(unresolved)] = unresolved
+    return n_active + len(unresolved)
+
+
+def rank_sorted_pairs(pairs, first_position, ranks, active, n_active, block_size):
+    """
+    Function to support the burrows_wheeler_direct function. It receives the sorted pairs (key in the high 32 bits, 
+    suffix in the low 32 bits) of the suffixes occupying the positions of the suffix array from first_position, and 
+    ranks them through the rank_sorted_block function, a block at a time. It returns the new length of active.
+    """
+    for start in range(0, len(pairs), block_size):
+        end = min(start + block_size, len(pairs))
+        previous_key = pairs[start - 1] >> np.uint64(32) if start > 0 else None
+        previous_start = ranks[pairs[start - 1] & np.uint64(0xFFFFFFFF)] if start > 0 else 0
+        next_key = pairs[end] >> np.uint64(32) if end < len(pairs) else None
+        n_active = rank_sorted_block(pairs[start:end] >> np.uint64(32), (pairs[start:end] & np.uint64(0xFFFFFFFF)).astype(np.int64),
+                                     np.arange(first_position + start, first_position + end), ranks, active, n_active, previous_key, previous_start, next_key)
+    return n_active
+
+
+def burrows_wheeler_direct(seq, block_size=2**18):
+    """
+    Function to convert and return the received sequence in the BWT format (bytes) without building the suffix array. 
+    It follows the prefix doubling strategy of build_suffix_array_vectorized, but keeps only the ranks of the suffixes 
+    (4 bytes per base) and the list of the unresolved suffixes, processed in blocks of about block_size suffixes. 
+    At the end the ranks are the positions of the suffixes in the (never built) suffix array, so each character 
+    is written directly at its position in the BWT. The sequence must be shorter than 2^32 characters. 
+    The list of the suffixes sorted by bucket, later reused for the unresolved suffixes, needs 4 more bytes per base, 
+    so with the codes of the sequence (kept twice while the first k-mers are ranked) the memory is about 10 bytes 
+    per base, plus the temporary arrays of a block (about 40 bytes per suffix of 
+    the block, which is capped at 1/32 of the sequence): about 13 bytes per base at 1M and 8M bases.
+    """
+
+    # Convert to an array of codes and append the code of the character "$" to mark the end.
+    seq_array = np.append(encode_sequence(seq), np.uint8(0))
+    n = len(seq_array)
+    if n >= 2**32:
+        raise ValueError("The direct BWT conversion supports sequences shorter than 2^32 characters.")
+    ranks = np.empty(n, dtype=index_dtype(n))
+
+    # The temporary arrays of a block take several times the memory of the whole sequence per suffix, so the blocks 
+    # of short sequences are made smaller.
+    block_size = min(block_size, max(2**14, n // 32))
+
+    # Remap the codes to the symbols actually present, as in the kmer_keys function. The first k characters of each 
+    # suffix fit in 32 bits (to be paired with the suffix in a 64-bit integer), and the first c characters in a 16-bit 
+    # bucket identifier. The remapped codes are followed by their first k characters, so that the characters after 
+    # the end of the string (restarting from its beginning) are read without wrapping the positions.
+    present = np.bincount(seq_array) > 0
+    bits = max(1, (int(present.sum()) - 1).bit_length())
+    k = min(32 // bits, n)
+    c = min(16 // bits, k)
+    dense = (np.cumsum(present) - 1).astype(np.uint8)[np.concatenate((seq_array, seq_array[:k]))]
+
+    def block_buckets(start, end):
+        # Bucket of the suffixes from start to end: their first c characters, read as slices since the positions are consecutive.
+        buckets = np.zeros(end - start, dtype=np.uint16)
+        for j in range(c):
+            buckets = (buckets << np.uint16(bits)) | dense[start + j:end + j]
+        return buckets
+
+    # Distribute the suffixes into buckets by their first c characters with a counting sort in two passes: count the 
+    # suffixes of each bucket, then write each suffix at the next free position of its bucket.
+    n_buckets = 1 << (c * bits)
+    bucket_counts = np.zeros(n_buckets, dtype=np.int64)
+    for start in range(0, n, block_size):
+        bucket_counts += np.bincount(block_buckets(start, min(start + block_size, n)), minlength=n_buckets)
+    bucket_bounds = np.concatenate(([0], np.cumsum(bucket_counts)))
+    suffixes_by_bucket = np.empty(n, dtype=index_dtype(n))
+    next_free = bucket_bounds[:-1].copy()
+    for start in range(0, n, block_size):
+        buckets = block_buckets(start, min(start + block_size, n))
+        sorted_indices = np.argsort(buckets, kind='stable')
+        counts = np.bincount(buckets, minlength=n_buckets)
+        offsets = np.arange(len(buckets)) - (np.cumsum(counts) - counts)[buckets[sorted_indices]]
+        suffixes_by_bucket[next_free[buckets[sorted_indices]] + offsets] = sorted_indices + start
+        next_free += counts
+
+    # Rank the suffixes by their first k characters, a range of buckets (about block_size suffixes, or a single larger 
+    # bucket) at a time. The pairs (k-mer key, suffix) of the range are sorted in place. As in build_suffix_array_vectorized, 
+    # the rank of a suffix is the position where its group starts in the suffix array. The suffixes of the unresolved 
+    # groups are kept in active, in suffix array order. active reuses the memory of suffixes_by_bucket: it never grows 
+    # beyond the buckets already ranked.
+    active, n_active = suffixes_by_bucket, 0
+    first_bucket = 0
+    while first_bucket < n_buckets:
+        last_bucket = max(first_bucket + 1, int(np.searchsorted(bucket_bounds, bucket_bounds[first_bucket] + block_size, side='right')) - 1)
+        pairs = np.empty(bucket_bounds[last_bucket] - bucket_bounds[first_bucket], dtype=np.uint64)
+        for start in range(bucket_bounds[first_bucket], bucket_bounds[last_bucket], block_size):
+            positions = suffixes_by_bucket[start:min(start + block_size, bucket_bounds[last_bucket])].astype(np.int64)
+            keys = np.zeros(len(positions), dtype=np.uint64)
+            for j in range(k):
+                keys = (keys << np.uint64(bits)) | dense[positions + j]
+            pairs[start - bucket_bounds[first_bucket]:start - bucket_bounds[first_bucket] + len(positions)] = (keys << np.uint64(32)) | positions.astype(np.uint64)
+        pairs.sort()
+        n_active = rank_sorted_pairs(pairs, bucket_bounds[first_bucket], ranks, active, n_active, block_size)
+        first_bucket = last_bucket
+    del dense, pairs
+
+    # In each round, sort the unresolved groups by the rank k positions ahead, a block of whole groups at a time. 
+    # The ranks are updated in place: every group is refined at once, and the refined ranks of a group stay within 
+    # its positions, so the ranks read by the next blocks remain consistent.
+    while n_active > 0 and k < n:
+        start, n_unresolved = 0, 0
+        while start < n_active:
+
+            # The block must contain whole groups: it ends before the group at its boundary or, if a single group 
+            # fills the whole block, after the end of this group.
+            end = min(start + block_size, n_active)
+            if end < n_active:
+                group_ranks = ranks[active[start:end + 1]]
+                first = int(np.searchsorted(group_ranks, group_ranks[-1]))
+                if first > 0:
+                    end = start + first
+                else:
+                    while end < n_active and ranks[active[end]] == group_ranks[-1]:
+                        end = min(end + block_size, n_active)
+                    end = start + int(np.searchsorted(ranks[active[start:end]], group_ranks[-1], side='right'))
+
+            if end - start > block_size:
+                # A single large group: sort the pairs (rank k positions ahead, suffix) in place.
+                group_start = int(ranks[active[start]])
+                pairs = np.empty(end - start, dtype=np.uint64)
+                for offset in range(start, end, block_size):
+                    suffixes = active[offset:min(offset + block_size, end)].astype(np.int64)
+                    pairs[offset - start:offset - start + len(suffixes)] = (ranks[(suffixes + k) % n].astype(np.uint64) << np.uint64(32)) | suffixes.astype(np.uint64)
+                pairs.sort()
+                n_unresolved = rank_sorted_pairs(pairs, group_start, ranks, active, n_unresolved, block_size)
+                del pairs
+            else:
+                # Sort the block by the rank pairs: the first rank is the start of the group, so each group is sorted 
+                # within the positions it already occupies in the suffix array.
+                suffixes = active[start:end].astype(np.int64)
+                group_ranks = ranks[suffixes].astype(np.int64)
+                suffix_keys = pack_rank_pairs(group_ranks, ranks[(suffixes + k) % n])
+                sorted_indices = np.argsort(suffix_keys, kind='stable')
+
+                # Position of each suffix in the suffix array: the start of its group plus its offset in the group.
+                group_boundaries = np.concatenate(([True], group_ranks[1:] != group_ranks[:-1]))
+                offsets = np.arange(len(suffixes))
+                sa_positions = group_ranks + offsets - np.maximum.accumulate(np.where(group_boundaries, offsets, 0))
+                n_unresolved = rank_sorted_block(suffix_keys[sorted_indices], suffixes[sorted_indices], sa_positions, ranks, active, n_unresolved)
+            start = end
+
+        n_active = n_unresolved
+        k *= 2
+    del active
+
+    # Write each character at the position of the following suffix in the suffix array: the BWT takes, for each 
+    # suffix, the code that precedes it in the original sequence.
+    # The characters are written directly, so the result needs no decoding pass.
+    bwt_result = np.empty(n, dtype=np.uint8)
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        bwt_result[ranks[start:end]] = DECODE_TABLE[seq_array[np.arange(start - 1, end - 1)]]
+    return bwt_result.tobytes()
+
+
+
+
+# Functions for the external-memory BWT transformation
+
+def read_cyclic(array, start, length):
+    """
+    Function to support the external-memory functions. It returns (in memory) length elements of the disk-backed 
+    array starting at position start, restarting from the beginning of the array if its end is reached.
+    """
+    n = len(array)
+    start %= n
+    parts = [array[start:start + length]]
+    remaining = length - len(parts[0])
+    while remaining > 0:
+        parts.append(array[:min(remaining, n)])
+        remaining -= len(parts[-1])
+    return np.concatenate(parts)
+
+
+def external_sort(keys, indices, block_size, scratch_dir):
+    """
+    Function to support the build_suffix_array_external function. It sorts the disk-backed keys together with their 
+    indices in place, loading about block_size elements in memory at a time. Larger arrays are distributed into buckets 
+    by key ranges, with the splitters taken from a sample of the keys, and each bucket is sorted recursively.
+    """
+
+    n = len(keys)
+
+    # Small enough arrays are sorted directly in memory.
+    if n <= block_size:
+        block_keys, block_indices = np.array(keys), np.array(indices)
+        sorted_indices = np.argsort(block_keys)
+        keys[:] = block_keys[sorted_indices]
+        indices[:] = block_indices[sorted_indices]
+        return
+
+    # Choose the splitters among a sample of the keys. Each sampled key v gives a bucket [v, v + 1) containing only 
+    # the key v (so that frequent keys end up in buckets that need no sorting) and a bucket [v + 1, next splitter).
+    sample = np.unique(keys[np.sort(np.random.default_rng(0).integers(0, n, min(n, 65536)))])
+    sample = np.unique(sample[np.linspace(0, len(sample) - 1, min(len(sample), 2 * (n // block_size + 1))).astype(np.int64)])
+    largest = np.iinfo(keys.dtype).max
+    splitters = np.unique(np.concatenate((sample, sample[sample < largest] + np.uint64(1))))
+    n_buckets = len(splitters) + 1
+
+    # Buckets that can only contain a single key: the buckets [v, v + 1) and, if the largest key was sampled, the last one.
+    single_key = np.zeros(n_buckets, dtype=bool)
+    single_key[1:-1] = np.diff(splitters) == 1
+    single_key[-1] = splitters[-1] == largest
+
+    # First pass: count the elements of each bucket.
+    counts = np.zeros(n_buckets, dtype=np.int64)
+    for start in range(0, n, block_size):
+        counts += np.bincount(np.searchsorted(splitters, keys[start:start + block_size], side='right'), minlength=n_buckets)
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+
+    # Second pass: distribute the elements into temporary disk-backed arrays, bucket after bucket, then copy them back.
+    temp_keys = np.memmap(os.path.join(scratch_dir, f"keys_{n}_{id(keys)}"), dtype=keys.dtype, mode="w+", shape=(n,))
+    temp_indices = np.memmap(os.path.join(scratch_dir, f"indices_{n}_{id(keys)}"), dtype=indices.dtype, mode="w+", shape=(n,))
+    positions = bounds[:-1].copy()
+    for start in range(0, n, block_size):
+        block_keys, block_indices = np.array(keys[start:start + block_size]), np.array(indices[start:start + block_size])
+        buckets = np.searchsorted(splitters, block_keys, side='right')
+        sorted_indices = np.argsort(buckets, kind='stable')
+        block_bounds = np.concatenate(([0], np.cumsum(np.bincount(buckets, minlength=n_buckets))))
+        for bucket in np.unique(buckets):
+            segment = sorted_indices[block_bounds[bucket]:block_bounds[bucket + 1]]
+            temp_keys[positions[bucket]:positions[bucket] + len(segment)] = block_keys[segment]
+            temp_indices[positions[bucket]:positions[bucket] + len(segment)] = block_indices[segment]
+            positions[bucket] += len(segment)
+    for start in range(0, n, block_size):
+        keys[start:start + block_size] = temp_keys[start:start + block_size]
+        indices[start:start + block_size] = temp_indices[start:start + block_size]
+    for temp in (temp_keys, temp_indices):
+        os.remove(temp.filename)
+    del temp_keys, temp_indices
+
+    # Sort each bucket, unless it contains a single key.
+    for bucket in range(n_buckets):
+        if counts[bucket] > 1 and not single_key[bucket]:
+            external_sort(keys[bounds[bucket]:bounds[bucket + 1]], indices[bounds[bucket]:bounds[bucket + 1]], block_size, scratch_dir)
+
+
+def build_suffix_array_external(codes, scratch_dir, block_size=2**22):
+    """
+    Function to build the suffix array of the received codes with the prefix doubling strategy, keeping the keys, 
+    the ranks and the suffix array in disk-backed numpy.memmap files in the scratch_dir directory. Each pass loads 
+    about block_size elements in memory at a time. It returns the suffix array as a memmap.
+    """
+
+    n = len(codes)
+    check_rank_pairs_length(n)
+    keys = np.memmap(os.path.join(scratch_dir, "keys"), dtype=np.uint64, mode="w+", shape=(n,))
+    ranks = np.memmap(os.path.join(scratch_dir, "ranks"), dtype=index_dtype(n), mode="w+", shape=(n,))
+    suffix_array = np.memmap(os.path.join(scratch_dir, "suffix_array"), dtype=index_dtype(n), mode="w+", shape=(n,))
+
+    # As in the kmer_ranks function, remap the codes to the symbols actually present and find how many characters fit in a 64-bit key.
+    counts = np.zeros(256, dtype=np.int64)
+    for start in range(0, n, block_size):
+        counts += np.bincount(codes[start:start + block_size], minlength=256)
+    dense = (np.cumsum(counts > 0) - 1).astype(np.uint64)
+    bits = max(1, (int(np.count_nonzero(counts)) - 1).bit_length())
+    k = 1
+    while 2 * k * bits <= 64 and k < n:
+        k *= 2
+
+    # The first keys are the packed k-mers starting at each position (restarting from the beginning of the string if its end is reached).
+    for start in range(0, n, block_size):
+        length = min(block_size, n - start)
+        window = dense[read_cyclic(codes, start, length + k - 1)]
+        block_keys = np.zeros(length, dtype=np.uint64)
+        for j in range(k):
+            block_keys = (block_keys << np.uint64(bits)) | window[j:j + length]
+        keys[start:start + length] = block_keys
+        suffix_array[start:start + length] = np.arange(start, start + length)
+
+    while True:
+
+        # Sort the suffixes by their keys.
+        external_sort(keys, suffix_array, block_size, scratch_dir)
+
+        # Scan the sorted keys: a new group starts wherever a key differs from the previous one, and the rank of the suffixes 
+        # of a group is the position where it starts. The last key and group start of each block are carried to the next one.
+        n_groups, last_key, last_start = 0, None, 0
+        for start in range(0, n, block_size):
+            block_keys = np.array(keys[start:start + block_size])
+            boundaries = np.concatenate(([last_key is None or block_keys[0] != last_key], block_keys[1:] != block_keys[:-1]))
+            group_starts = np.maximum.accumulate(np.where(boundaries, np.arange(start, start + len(block_keys)), last_start))
+            ranks[suffix_array[start:start + block_size]] = group_starts
+            n_groups += np.count_nonzero(boundaries)
+            last_key, last_start = block_keys[-1], group_starts[-1]
+
+        # Stop if all the suffixes have distinct ranks.
+        if n_groups == n or k >= n:
+            return suffix_array
+
+        # Build the keys of the next round in text order, so that the ranks are read sequentially: the current rank of each 
+        # suffix and its rank k positions ahead, packed together.
+        for start in range(0, n, block_size):
+            length = min(block_size, n - start)
+            keys[start:start + length] = pack_rank_pairs(np.array(ranks[start:start + length]), read_cyclic(ranks, start + k, length))
+            suffix_array[start:start + length] = np.arange(start, start + length)
+        k *= 2
+
+
+def burrows_wheeler_external_blocks(seq, scratch_dir=None, block_size=2**22):
+    """
+    Function to convert the received sequence in the BWT format in external memory (see burrows_wheeler_external), 
+    yielding the BWT a block of block_size characters (bytes) at a time. The codes of the sequence are written to their 
+    disk-backed file a block at a time, and each block of the BWT is read from the disk-backed suffix array only when 
+    it is requested, so neither the codes nor the BWT are ever held in memory as a whole.
+    """
+
+    with tempfile.TemporaryDirectory(dir=scratch_dir) as workdir:
+
+        # Store the codes of the sequence, followed by the code of the character "$", in a disk-backed file.
+        n = len(seq) + 1
+        codes = np.memmap(os.path.join(workdir, "codes"), dtype=np.uint8, mode="w+", shape=(n,))
+        for start in range(0, n - 1, block_size):
+            codes[start:min(start + block_size, n - 1)] = encode_sequence(seq[start:start + block_size])
+        codes[-1] = 0
 
-    # Join into a single string and return the original sequence without the terminator character
-    return ''.join(original_seq)[:-1]
+        suffix_array = build_suffix_array_external(codes, workdir, block_size)
 
+        # Create the BWT block by block: for each index i in the suffix array, take the character at i-1 in the original sequence.
+        for start in range(0, n, block_size):
+            yield decode_bytes(codes[cyclic_shift(np.array(suffix_array[start:start + block_size]), n - 1, n)])
+        del codes, suffix_array
 
+
+def burrows_wheeler_external(seq, scratch_dir=None, block_size=2**22):
+    """
+    Function to convert and return the received sequence in the BWT format (bytes) in external memory: the suffix array and 
+    the ranks are kept in disk-backed files in a temporary directory created inside scratch_dir (the default temporary 
+    directory if None), so that sequences larger than the available memory can be converted. The BWT is joined from the 
+    blocks of burrows_wheeler_external_blocks, which can be used instead to stream it without holding it in memory.
+    """
+    return b"".join(burrows_wheeler_external_blocks(seq, scratch_dir, block_size))
+
+
+
+# Functions for BWT reversion
+
+def map_last_to_first(bwt):
+    """
+    Function that implements LF mapping with array operations only:
+        - Takes the bwt string (last column) as input.
+        - Sorts its positions by character with a stable sort, which gives the first column: the characters are grouped 
+          by symbol (each group starts at the count of the smaller symbols), and within each group they keep their order 
+          of the last column (their rank).
+        - Returns the final array with the indexes, where each position of the last column points to its position in the first column.
+    """
+    
+    # Convert to an array of codes.
+    bwt_array = encode_sequence(bwt)
+    n = len(bwt_array)
+
+    # The stable sort of the codes (a radix sort for uint8) lists the positions of the last column in the order of the 
+    # first column: the position sorted at index j is mapped to j, i.e. to the first occurrence of its character in the 
+    # first column plus its rank.
+    order = np.argsort(bwt_array, kind='stable')
+    last_to_first = np.empty(n, dtype=index_dtype(n))
+    last_to_first[order] = np.arange(n, dtype=index_dtype(n))
+
+    return last_to_first
+
+
+def invert_bwt_sequential(bwt_array):
+    """
+    Function to reverse the bwt codes with a single LF walk and return the codes of the original sequence, 
+    with the terminator character at the end.
+    """
+    # This line calls the map_last_to_first function to store the positions of the characters present
+    # in the bwt string mapped in the sorted bwt string (first column).
+    last_to_first = map_last_to_first(bwt_array)
+    n = len(bwt_array)
+    
+    # Get the index of the terminator character (code 0).
+    idx = np.flatnonzero(bwt_array == 0)[0]
+
+    # Array to store the codes of the reconstructed sequence, which is filled from the end.
+    original_seq = np.empty(n, dtype=np.uint8)
+
+    # The loop iterates for the length of the bwt string, storing the codes in "original_seq" 
+    # in reverse order using the last_to_first mapping.    
+    for i in range(n - 1, -1, -1):
+        original_seq[i] = bwt_array[idx]      # Get the code at index "idx" in the bwt string
+        idx = last_to_first[idx]      # Update idx 
+
+    return original_seq
+
+
+def invert_bwt_pointer_jumping(bwt_array):
+    """
+    Function to reverse the bwt codes by pointer jumping and return the codes of the original sequence, with the 
+    terminator character at the end. The LF walk visits all the rows in a single cycle: cutting it before the row of 
+    the terminator, the position of each character in the original sequence is its distance from the end of the walk. 
+    The distances are found in log(n) rounds, where each row adds the distance of the row it points to and then 
+    points to the row that one points to (the LF mapping composed with itself), so the characters are scattered 
+    into the original sequence with a single array operation, at the cost of two extra index arrays.
+    """
+    n = len(bwt_array)
+    successor = map_last_to_first(bwt_array)
+
+    # The walk starts from the row of the terminator character and ends at the row mapped to it, which points to itself.
+    start = np.flatnonzero(bwt_array == 0)[0]
+    end = np.flatnonzero(successor == start)[0]
+    successor[end] = end
+    distance = np.ones(n, dtype=successor.dtype)
+    distance[end] = 0
+
+    # Double the jumps until the start of the walk (the farthest row from its end) points to the end.
+    if n < 2**32:
+        # Distance and successor are packed into a single uint64 key (the distance in the high 32 bits), so that 
+        # each round gathers both with a single random access.
+        low_bits = np.uint64(2**32 - 1)
+        packed = (distance.astype(np.uint64) << np.uint64(32)) | successor
+        while int(packed[start]) & (2**32 - 1) != end:
+            gathered = packed[packed & low_bits]
+            packed >>= np.uint64(32)
+            packed += gathered >> np.uint64(32)
+            packed <<= np.uint64(32)
+            packed |= gathered & low_bits
+        distance = (packed >> np.uint64(32)).astype(successor.dtype)
+    else:
+        while successor[start] != end:
+            distance += distance[successor]
+            successor = successor[successor]
+
+    # The row at distance d from the end of the walk holds the character at position d of the original sequence.
+    original_seq = np.empty(n, dtype=np.uint8)
+    original_seq[distance] = bwt_array
+    return original_seq
+
+
+def attach_walk_arrays(buffers, dtypes):
+    """
+    Function to initialize the workers of the bidirectional inverse. It wraps the received shared memory buffers 
+    (a dictionary name: buffer) into NumPy arrays of the received dtypes, without copying them.
+    """
+    for name, buffer in buffers.items():
+        SHARED_ARRAYS[name] = np.frombuffer(buffer, dtype=dtypes[name])
+
+
+def walk_bwt(task):
+    """
+    Function to support the invert_bwt_bidirectional function. It runs a walk over the shared arrays named in the task 
+    (codes, mapping, start row, first position, step and number of steps): at each step, it writes the code of the 
+    current row at the current position of the shared output and moves to the row given by the mapping.
+    """
+    codes_name, mapping_name, idx, position, step, n_steps = task
+    codes, mapping, original_seq = SHARED_ARRAYS[codes_name], SHARED_ARRAYS[mapping_name], SHARED_ARRAYS["original_seq"]
+    for _ in range(n_steps):
+        original_seq[position] = codes[idx]
+        idx = mapping[idx]
+        position += step
+
+
+def invert_bwt_bidirectional(bwt_array):
+    """
+    Function to reverse the bwt codes with two walks running at the same time in two processes, and return the codes 
+    of the original sequence with the terminator character at the end. Both walks start from the row of the terminator 
+    character, which is the rotation starting with the first character of the sequence: the backward walk uses the LF 
+    mapping and reads the last column, filling the second half of the sequence from its end, while the forward walk uses 
+    the FL mapping (the inverse of LF) and reads the first column, filling the first half from its start.
+    """
+    n = len(bwt_array)
+    if n < 2**16:
+        return invert_bwt_sequential(bwt_array)
+    dtype = index_dtype(n)
+    start = int(np.flatnonzero(bwt_array == 0)[0])
+
+    # Shared memory for the columns, the mappings and the output. The first column is the last one in the order of the FL mapping.
+    typecode = 'I' if dtype == np.uint32 else 'q'
+    buffers = {"last_column": multiprocessing.RawArray('B', n), "first_column": multiprocessing.RawArray('B', n), 
+               "last_to_first": multiprocessing.RawArray(typecode, n), "first_to_last": multiprocessing.RawArray(typecode, n),
+               "original_seq": multiprocessing.RawArray('B', n)}
+    dtypes = {"last_column": np.uint8, "first_column": np.uint8, "last_to_first": dtype, "first_to_last": dtype, "original_seq": np.uint8}
+    arrays = {name: np.frombuffer(buffer, dtype=dtypes[name]) for name, buffer in buffers.items()}
+    arrays["last_column"][:] = bwt_array
+    arrays["last_to_first"][:] = map_last_to_first(bwt_array)
+    arrays["first_to_last"][arrays["last_to_first"]] = np.arange(n, dtype=dtype)
+    arrays["first_column"][:] = bwt_array[arrays["first_to_last"]]
+
+    # The daemonic processes (e.g. the workers of a multiprocessing.Pool) cannot create other processes, so they use threads.
+    pool_class = multiprocessing.pool.ThreadPool if multiprocessing.current_process().daemon else multiprocessing.Pool
+    with pool_class(2, initializer=attach_walk_arrays, initargs=(buffers, dtypes)) as pool:
+        pool.map(walk_bwt, [("last_column", "last_to_first", start, n - 1, -1, n - n // 2),
+                            ("first_column", "first_to_last", start, 0, 1, n // 2)])
+
+    return arrays["original_seq"].copy()
+
+
+def walk_bwt_lockstep(task):
+    """
+    Function to support the invert_bwt_checkpoints function. It runs the received LF walks (start rows, first positions 
+    and numbers of steps, sorted by number of steps) in lockstep over the shared arrays: at each step, every walk writes 
+    the code of its row at its position of the shared output and moves to the previous position and row.
+    """
+    rows, positions, n_steps = task
+    bwt_array, last_to_first, original_seq = SHARED_ARRAYS["last_column"], SHARED_ARRAYS["last_to_first"], SHARED_ARRAYS["original_seq"]
+    n_done = 0
+    for step in range(int(n_steps[-1]) if len(n_steps) else 0):
+        # Drop the walks that have completed their steps (the first ones, since they are sorted by number of steps).
+        while n_steps[n_done] == step:
+            n_done += 1
+        rows, positions = rows[n_done:], positions[n_done:]
+        n_steps = n_steps[n_done:]
+        n_done = 0
+        original_seq[positions] = bwt_array[rows]
+        rows = last_to_first[rows]
+        positions -= 1
+
+
+def invert_bwt_checkpoints(bwt_array, checkpoint_rows, checkpoint_positions, n_workers=None):
+    """
+    Function to reverse the bwt codes starting one LF walk from each checkpoint (the row of the suffix starting at 
+    a known position of the sequence), and return the codes of the original sequence with the terminator character 
+    at the end. The walk starting from the position p fills the sequence backwards from p - 1 to the previous checkpoint 
+    (the row of the terminator character is the checkpoint of position 0, filling the end of the sequence). The walks 
+    run in lockstep, split among n_workers processes (the number of CPU cores by default) sharing the output.
+    """
+    n = len(bwt_array)
+    dtype = index_dtype(n)
+
+    # Add the checkpoint of position 0 if it is missing, and sort the checkpoints by position.
+    rows = np.append(np.asarray(checkpoint_rows, dtype=np.int64), np.flatnonzero(bwt_array == 0)[0])
+    positions = np.append(np.asarray(checkpoint_positions, dtype=np.int64), 0)
+    positions, unique = np.unique(positions, return_index=True)
+    rows = rows[unique]
+
+    # Each walk fills the positions from its own one down to the previous checkpoint (the walk of position 0 wraps 
+    # around to the end of the sequence). The walks are sorted by number of steps.
+    n_steps = np.diff(positions, prepend=positions[-1] - n)
+    first_positions = (positions - 1) % n
+    by_steps = np.argsort(n_steps, kind='stable')
+    rows, first_positions, n_steps = rows[by_steps].astype(dtype), first_positions[by_steps], n_steps[by_steps]
+
+    # Shared memory for the last column, the LF mapping and the output, and the walks split among the workers.
+    n_workers = min(n_workers or multiprocessing.cpu_count(), len(rows))
+    typecode = 'I' if dtype == np.uint32 else 'q'
+    buffers = {"last_column": multiprocessing.RawArray('B', n), "last_to_first": multiprocessing.RawArray(typecode, n),
+               "original_seq": multiprocessing.RawArray('B', n)}
+    dtypes = {"last_column": np.uint8, "last_to_first": dtype, "original_seq": np.uint8}
+    arrays = {name: np.frombuffer(buffer, dtype=dtypes[name]) for name, buffer in buffers.items()}
+    arrays["last_column"][:] = bwt_array
+    arrays["last_to_first"][:] = map_last_to_first(bwt_array)
+    tasks = [(rows[i::n_workers], first_positions[i::n_workers], n_steps[i::n_workers]) for i in range(n_workers)]
+
+    if n_workers == 1:
+        attach_walk_arrays(buffers, dtypes)
+        walk_bwt_lockstep(tasks[0])
+    else:
+        # The daemonic processes (e.g. the workers of a multiprocessing.Pool) cannot create other processes, so they use threads.
+        pool_class = multiprocessing.pool.ThreadPool if multiprocessing.current_process().daemon else multiprocessing.Pool
+        with pool_class(n_workers, initializer=attach_walk_arrays, initargs=(buffers, dtypes)) as pool:
+            pool.map(walk_bwt_lockstep, tasks)
+
+    return arrays["original_seq"].copy()
+
+
+# Number of rows between two samples of the occurrence counts used by the invert_bwt_sampled function.
+OCC_SAMPLE_RATE = 256
+
+
+def sample_occurrences(bwt_array, sample_rate=OCC_SAMPLE_RATE, block_size=2**18):
+    """
+    Function to support the invert_bwt_sampled function. It returns the total count of each byte value (0-255) in 
+    the received bwt array (codes or characters), the byte values present and their occurrence counts sampled every 
+    sample_rate rows: the row j of the samples holds the number of occurrences of each value before the row 
+    j * sample_rate. The counts are computed in blocks of block_size values, so that no array of the length of 
+    the BWT is allocated besides the samples.
+    """
+    n = len(bwt_array)
+    counts = sum(np.bincount(bwt_array[start:start + block_size], minlength=256) for start in range(0, n, block_size))
+    symbols = np.flatnonzero(counts)
+    n_samples = n // sample_rate
+    samples = np.zeros((n_samples + 1, len(symbols)), dtype=index_dtype(n))
+
+    # Count the symbols in each group of sample_rate rows (the rows after the last sample are never needed), 
+    # then accumulate the counts of the groups.
+    groups = bwt_array[:n_samples * sample_rate].reshape(n_samples, sample_rate)
+    rows_per_block = max(1, block_size // sample_rate)
+    for start in range(0, n_samples, rows_per_block):
+        block = groups[start:start + rows_per_block]
+        for col, symbol in enumerate(symbols):
+            samples[start + 1:start + 1 + len(block), col] = np.count_nonzero(block == symbol, axis=1)
+    np.cumsum(samples, axis=0, out=samples)
+
+    return counts, symbols, samples
+
+
+def invert_bwt_sampled(bwt, sample_rate=OCC_SAMPLE_RATE, block_size=2**18, characters=False):
+    """
+    Function to reverse the bwt (bytes of characters, or an array of codes) with a single LF walk, computing the LF 
+    mapping on the fly instead of storing it, and return the codes of the original sequence with the terminator character 
+    at the end, or its characters (bytearray) if characters is True, without the conversion into codes. The LF mapping of a row is the first row of its symbol in the first column plus its rank, which is the 
+    sampled count of the symbol before the row (see sample_occurrences) plus its occurrences between the sample and 
+    the row, counted on the bwt bytes. The walk reads the received bytes directly, since the characters of ALPHABET are 
+    in the same order as their codes, so besides them and the output (one byte per base each), only the samples are 
+    stored (a few bits per base).
+    """
+    bwt_bytes = decode_bytes(bwt) if isinstance(bwt, np.ndarray) else (bwt.encode() if isinstance(bwt, str) else bytes(bwt))
+    n = len(bwt_bytes)
+    counts, symbols, samples = sample_occurrences(np.frombuffer(bwt_bytes, dtype=np.uint8), sample_rate, block_size)
+    if np.any(ENCODE_TABLE[symbols] == INVALID_CODE):
+        raise ValueError("The sequence contains invalid symbols.")
+
+    # First row of each character in the first column (the number of smaller characters), and the column of each 
+    # character in the samples.
+    first_row = (np.cumsum(counts) - counts).tolist()
+    column = [0] * 256
+    for col, symbol in enumerate(symbols.tolist()):
+        column[symbol] = col
+    n_symbols = len(symbols)
+    flat_samples = memoryview(samples.reshape(-1))      # Indexing a memoryview returns Python integers, faster than NumPy scalars
+
+    # Get the index of the terminator character.
+    idx = bwt_bytes.index(b"$")
+
+    # The characters of the reconstructed sequence are stored from the end, as in the invert_bwt_sequential function.
+    original_seq = bytearray(n)
+    for i in range(n - 1, -1, -1):
+        char = bwt_bytes[idx]
+        original_seq[i] = char
+        sample = idx // sample_rate
+        rank = flat_samples[sample * n_symbols + column[char]] + bwt_bytes.count(char, sample * sample_rate, idx)
+        idx = first_row[char] + rank
+
+    if characters:
+        return original_seq
+
+    # Convert the characters into their codes in place, in blocks.
+    original_array = np.frombuffer(original_seq, dtype=np.uint8)
+    for start in range(0, n, block_size):
+        original_array[start:start + block_size] = ENCODE_TABLE[original_array[start:start + block_size]]
+    return original_array
+
+
+# Registry of the inverse BWT engines that can be selected in the revert_burrows_wheeler function.
+REVERT_ENGINES = {
+    "sequential": invert_bwt_sequential,
+    "pointer_jumping": invert_bwt_pointer_jumping,
+    "bidirectional": invert_bwt_bidirectional,
+    "sampled": invert_bwt_sampled,
+}
+
+
+def revert_burrows_wheeler(bwt, engine="sequential", as_bytes=False):
+    """
+    Function to reverse the bwt string and return the original sequence (str, or bytes-like if as_bytes is True). 
+    The engine used to invert the BWT can be selected among the ones in REVERT_ENGINES.
+    """
+
+    if engine not in REVERT_ENGINES:
+        raise ValueError(f"Unknown inverse BWT engine: {engine}.")
+
+    # The sampled engine reads the received bytes directly, to avoid a second copy of the BWT, and with as_bytes it 
+    # writes the characters straight into its output, which is returned without the terminator and without any copy.
+    if engine == "sampled" and as_bytes:
+        original_seq = invert_bwt_sampled(bwt, characters=True)
+        del original_seq[-1]
+        return original_seq
+
+    # Convert to an array of codes and invert the BWT with the selected engine.
+    original_seq = REVERT_ENGINES[engine](bwt if engine == "sampled" else encode_sequence(bwt))
+
+    # Decode and return the original sequence without the terminator character
+    return decode_bytes(original_seq[:-1]) if as_bytes else decode_sequence(original_seq[:-1])
+
+
+
+
+# Functions for the run-length encoded BWT (RLBWT)
+
+def run_length_encode(bwt):
+    """
+    Function to split the received BWT into its runs of equal characters. It returns the codes of the runs and their lengths.
+    """
+    bwt_array = encode_sequence(bwt)
+    if len(bwt_array) == 0:
+        return bwt_array, np.zeros(0, dtype=np.int64)
+    run_starts = np.flatnonzero(np.concatenate(([True], bwt_array[1:] != bwt_array[:-1])))
+    return bwt_array[run_starts], np.diff(np.append(run_starts, len(bwt_array)))
+
+
+def format_rlbwt(run_codes, run_lengths, block_size=2**18):
+    """
+    Function to write the runs of a BWT in the RLBWT format (bytes): each run is its character followed by its 
+    length in decimal digits (e.g. "TTTTT$AAAAA" becomes "T5$1A5"). The output is written with array operations, 
+    mirroring parse_rlbwt: the number of digits of each length gives the position of each run in the output, and 
+    the digits are written one decimal place at a time, for the runs of block_size at a time.
+    """
+
+    # Number of digits of each run length, and size of the output (a character and its digits for each run).
+    n_digits = np.ones(len(run_lengths), dtype=np.uint8)
+    for exponent in range(1, 20):
+        n_digits += run_lengths >= 10 ** exponent
+    output = np.empty(len(run_lengths) + int(n_digits.sum(dtype=np.int64)), dtype=np.uint8)
+
+    offset = 0
+    for start in range(0, len(run_lengths), block_size):
+        lengths, digits = run_lengths[start:start + block_size].astype(np.int64), n_digits[start:start + block_size]
+
+        # Position of the character of each run, followed by its digits (the last digit at position + n_digits).
+        positions = offset + np.concatenate(([0], np.cumsum(1 + digits.astype(np.int64))[:-1]))
+        output[positions] = DECODE_TABLE[run_codes[start:start + block_size]]
+        for place in range(int(digits.max())):
+            has_place = digits > place
+            output[(positions + digits)[has_place] - place] = ord("0") + (lengths[has_place] // 10 ** place) % 10
+        offset = int(positions[-1]) + 1 + int(digits[-1])
+
+    return output.tobytes()
+
+
+def format_rlbwt_blocks(bwt_blocks):
+    """
+    Function to write a BWT received as an iterable of blocks (bytes) in the RLBWT format, yielding the output of 
+    each block (see format_rlbwt). The last run of each block is held back, since it can continue in the next block.
+    """
+    last_code, last_length = None, 0
+    for block in bwt_blocks:
+        run_codes, run_lengths = run_length_encode(block)
+        if len(run_codes) == 0:
+            continue
+        if last_code is not None:
+            if run_codes[0] == last_code:
+                run_lengths[0] += last_length
+            else:
+                run_codes = np.concatenate((np.array([last_code], dtype=np.uint8), run_codes))
+                run_lengths = np.concatenate(([last_length], run_lengths))
+        last_code, last_length = int(run_codes[-1]), int(run_lengths[-1])
+        if len(run_codes) > 1:
+            yield format_rlbwt(run_codes[:-1], run_lengths[:-1])
+    if last_code is not None:
+        yield format_rlbwt(np.array([last_code], dtype=np.uint8), np.array([last_length], dtype=np.int64))
+
+
+def parse_rlbwt(rlbwt):
+    """
+    Function to read a BWT in the RLBWT format (str or bytes) without expanding it. It returns the codes of the runs 
+    and their lengths, and raises a ValueError if the format is invalid.
+    """
+    data = np.frombuffer(rlbwt.encode() if isinstance(rlbwt, str) else bytes(rlbwt), dtype=np.uint8)
+    is_digit = (data >= ord("0")) & (data <= ord("9"))
+    symbol_positions = np.flatnonzero(~is_digit)
+
+    # Each character must be followed by at least one digit, and the data must start with a character.
+    run_ends = np.append(symbol_positions[1:], len(data))
+    if len(data) == 0 or is_digit[0] or np.any(run_ends - symbol_positions < 2):
+        raise ValueError("Invalid RLBWT: each character must be followed by its run length.")
+
+    # Parse all the run lengths at once: each digit is weighted by the power of 10 of its distance from the end of its number.
+    digit_positions = np.flatnonzero(is_digit)
+    run_index = np.cumsum(~is_digit)[digit_positions] - 1
+    exponents = run_ends[run_index] - 1 - digit_positions
+    run_lengths = np.zeros(len(symbol_positions), dtype=np.int64)
+    np.add.at(run_lengths, run_index, (data[digit_positions] - ord("0")).astype(np.int64) * 10 ** exponents)
+
+    # Every run must be non-empty, and the terminator character must be a single run of length 1.
+    run_codes = encode_sequence(data[symbol_positions].tobytes())
+    if np.any(run_lengths == 0):
+        raise ValueError("Invalid RLBWT: the run lengths must be greater than 0.")
+    if np.count_nonzero(run_codes == 0) != 1 or run_lengths[run_codes == 0][0] != 1:
+        raise ValueError("Invalid RLBWT: the '$' terminator must be present exactly once, as a run of length 1.")
+
+    return run_codes, run_lengths
+
+
+def invert_rlbwt(run_codes, run_lengths):
+    """
+    Function to reverse a BWT given as runs with a single LF walk, without expanding it, and return the codes of the 
+    original sequence with the terminator character at the end. The LF mapping of a position is computed from its 
+    run: the characters of a run are consecutive in the first column, starting at the first column position of the run.
+    """
+
+    # Start of each run in the BWT, and start of each run in the first column: the runs sorted by character (stable, 
+    # so that equal characters keep their order, as in the LF mapping) occupy consecutive positions of the first column.
+    run_starts = np.concatenate(([0], np.cumsum(run_lengths)[:-1]))
+    sorted_runs = np.argsort(run_codes, kind='stable')
+    first_column_starts = np.empty(len(run_codes), dtype=np.int64)
+    first_column_starts[sorted_runs] = np.concatenate(([0], np.cumsum(run_lengths[sorted_runs])[:-1]))
+
+    # Python lists are faster than NumPy arrays for the single-element accesses of the walk.
+    starts, first_starts, codes = run_starts.tolist(), first_column_starts.tolist(), run_codes.tolist()
+    n = int(run_lengths.sum())
+    original_seq = np.empty(n, dtype=np.uint8)
+
+    # Walk from the run of the terminator character, filling the original sequence from the end.
+    run = codes.index(0)
+    idx = starts[run]
+    for i in range(n - 1, -1, -1):
+        original_seq[i] = codes[run]
+        idx = first_starts[run] + idx - starts[run]
+        run = bisect.bisect_right(starts, idx) - 1
+
+    return original_seq
+
+
+def revert_rlbwt(rlbwt):
+    """
+    Function to reverse a BWT in the RLBWT format and return the original sequence, without expanding the BWT.
+    """
+    return decode_sequence(invert_rlbwt(*parse_rlbwt(rlbwt))[:-1])
+
+
+
+
+# Functions for the block-sorting compression (BWT, move-to-front, zero-run-length and Huffman coding)
+
+# Symbols of the compressed stream: RUNA and RUNB encode the run lengths in bijective base 2 (as in bzip2), 
+# and the move-to-front value v of each run is encoded as the symbol v + MTF_OFFSET.
+RUNA, RUNB = 0, 1
+MTF_OFFSET = 2
+N_STREAM_SYMBOLS = len(ALPHABET) + MTF_OFFSET
+
+# Maximum length of a Huffman code: a Huffman tree of N_STREAM_SYMBOLS leaves is at most N_STREAM_SYMBOLS - 1 levels deep.
+MAX_CODE_LENGTH = N_STREAM_SYMBOLS - 1
+
+
+def move_to_front(codes, alphabet_size=len(ALPHABET)):
+    """
+    Function to return the move-to-front transform of the received codes with array operations only. The list starts 
+    with the codes in increasing order, so the value of a code is the number of distinct codes seen since its previous 
+    occurrence or, at its first occurrence, the number of distinct codes seen so far plus the number of unseen smaller codes.
+    """
+
+    positions = np.arange(len(codes), dtype=np.int64)
+
+    # Last occurrence of each code strictly before each position (-1 if none), computed one code at a time.
+    def last_occurrences(code):
+        last = np.maximum.accumulate(np.where(codes == code, positions, -1))
+        return np.concatenate(([-1], last[:-1]))
+
+    previous = np.full(len(codes), -1, dtype=np.int64)
+    for code in range(alphabet_size):
+        is_code = codes == code
+        previous[is_code] = last_occurrences(code)[is_code]
+
+    # Count, for each position, the codes seen after its previous occurrence (or the unseen smaller codes at its first occurrence).
+    mtf = np.zeros(len(codes), dtype=np.uint8)
+    for code in range(alphabet_size):
+        last = last_occurrences(code)
+        mtf += (last > previous) | ((previous < 0) & (last < 0) & (code < codes))
+    return mtf
+
+
+def inverse_move_to_front(mtf, alphabet_size=len(ALPHABET)):
+    """
+    Function to reverse the move-to-front transform and return the codes. The values are read sequentially, 
+    but only one per run of the BWT (see compress_sequence).
+    """
+    symbols = list(range(alphabet_size))
+    codes = np.empty(len(mtf), dtype=np.uint8)
+    for i, value in enumerate(mtf.tolist()):
+        symbol = symbols.pop(value)
+        symbols.insert(0, symbol)
+        codes[i] = symbol
+    return codes
+
+
+def encode_zero_runs(mtf, run_lengths):
+    """
+    Function to build the symbol stream of the runs of a BWT: the move-to-front value of each run followed by the number 
+    of repetitions of its character (the zeros of the move-to-front transform) written with RUNA and RUNB in bijective base 2.
+    """
+
+    # Number of RUNA/RUNB digits of each run: the number of bits of (repetitions + 1) without the leading one.
+    repetitions_plus_one = run_lengths.astype(np.int64)
+    n_digits = np.zeros(len(run_lengths), dtype=np.int64)
+    remaining = repetitions_plus_one >> 1
+    while np.any(remaining):
+        n_digits += remaining > 0
+        remaining >>= 1
+
+    # The value of each run is followed by its digits, the least significant first (RUNA for a 0 bit, RUNB for a 1 bit).
+    run_ends = np.cumsum(n_digits + 1)
+    value_positions = run_ends - n_digits - 1
+    stream = np.empty(int(run_ends[-1]) if len(run_ends) else 0, dtype=np.uint8)
+    stream[value_positions] = mtf + MTF_OFFSET
+
+    digit_runs = np.repeat(np.arange(len(run_lengths)), n_digits)
+    digit_positions = np.arange(len(digit_runs)) - np.repeat(np.cumsum(n_digits) - n_digits, n_digits)
+    is_digit = np.ones(len(stream), dtype=bool)
+    is_digit[value_positions] = False
+    stream[is_digit] = (repetitions_plus_one[digit_runs] >> digit_positions) & 1
+    return stream
+
+
+def decode_zero_runs(stream):
+    """
+    Function to split a symbol stream built by encode_zero_runs back into the move-to-front values and the run lengths.
+    """
+    is_value = stream >= MTF_OFFSET
+    value_positions = np.flatnonzero(is_value)
+    digit_positions = np.flatnonzero(~is_value)
+
+    # Each digit adds (digit + 1) * 2^j repetitions to its run, where j is its distance from the value of the run.
+    digit_runs = np.cumsum(is_value)[digit_positions] - 1
+    exponents = digit_positions - value_positions[digit_runs] - 1
+    run_lengths = np.ones(len(value_positions), dtype=np.int64)
+    np.add.at(run_lengths, digit_runs, (stream[digit_positions].astype(np.int64) + 1) << exponents)
+    return stream[value_positions] - MTF_OFFSET, run_lengths
+
+
+def huffman_code_lengths(frequencies):
+    """
+    Function to compute the length of the Huffman code of each symbol from its frequency (0 for absent symbols).
+    """
+    lengths = np.zeros(len(frequencies), dtype=np.uint8)
+    heap = [(int(frequency), [symbol]) for symbol, frequency in enumerate(frequencies) if frequency > 0]
+    if len(heap) == 1:
+        lengths[heap[0][1]] = 1
+    heapq.heapify(heap)
+
+    # Merge the two least frequent subtrees until a single tree is left: each merge adds a bit to the codes of their symbols.
+    while len(heap) > 1:
+        frequency1, symbols1 = heapq.heappop(heap)
+        frequency2, symbols2 = heapq.heappop(heap)
+        lengths[symbols1 + symbols2] += 1
+        heapq.heappush(heap, (frequency1 + frequency2, symbols1 + symbols2))
+    return lengths
+
+
+def canonical_codes(code_lengths):
+    """
+    Function to assign the canonical Huffman codes: the symbols sorted by code length (and then by symbol) 
+    receive consecutive codes, so only the code lengths need to be stored to decode them.
+    """
+    codes = np.zeros(len(code_lengths), dtype=np.int64)
+    code, previous_length = 0, 0
+    for symbol in sorted(np.flatnonzero(code_lengths).tolist(), key=lambda symbol: (code_lengths[symbol], symbol)):
+        code <<= int(code_lengths[symbol]) - previous_length
+        codes[symbol] = code
+        code, previous_length = code + 1, int(code_lengths[symbol])
+    return codes
+
+
+def huffman_encode(stream, code_lengths):
+    """
+    Function to encode the symbol stream with the canonical Huffman codes of the received code lengths. It returns 
+    the packed bits (bytes) and their number.
+    """
+    codes = canonical_codes(code_lengths)
+    stream_codes = codes[stream]
+    stream_lengths = code_lengths[stream].astype(np.int64)
+
+    # Bit j of the code of each symbol, the most significant first, gathered for all the symbols at once.
+    bit_starts = np.cumsum(stream_lengths) - stream_lengths
+    n_bits = int(stream_lengths.sum())
+    bit_symbols = np.repeat(np.arange(len(stream)), stream_lengths)
+    shifts = stream_lengths[bit_symbols] - 1 - (np.arange(n_bits) - bit_starts[bit_symbols])
+    bits = ((stream_codes[bit_symbols] >> shifts) & 1).astype(np.uint8)
+    return np.packbits(bits).tobytes(), n_bits
+
+
+def check_code_lengths(code_lengths):
+    """
+    Function to check that the received code lengths describe a complete prefix code, raising a ValueError otherwise: 
+    at least one symbol must have a code, no code can be longer than MAX_CODE_LENGTH, and the codes must satisfy 
+    the Kraft equality (the only exception is the single symbol, whose code has length 1). Otherwise some bit windows 
+    would not start with any code, and huffman_decode could not advance.
+    """
+    lengths = code_lengths[code_lengths > 0].astype(np.int64)
+    if len(lengths) == 0 or lengths.max() > MAX_CODE_LENGTH:
+        raise ValueError("Invalid compressed data: the code lengths are missing or too long.")
+    if len(lengths) == 1:
+        if lengths[0] != 1:
+            raise ValueError("Invalid compressed data: the code of a single symbol must have length 1.")
+    elif int(np.sum(np.int64(1) << (MAX_CODE_LENGTH - lengths))) != 2**MAX_CODE_LENGTH:
+        raise ValueError("Invalid compressed data: the code lengths do not describe a complete prefix code.")
+
+
+def huffman_decode(data, n_bits, code_lengths, block_size=2**20):
+    """
+    Function to decode the packed bits of huffman_encode back into the symbol stream. The next max_length bits at each 
+    bit position are looked up in a decoding table (computed one block of positions at a time), and the symbols are 
+    then read sequentially by jumping from a code to the next. It raises a ValueError if the code lengths are invalid 
+    (see check_code_lengths), if the data is shorter than n_bits or if a window does not start with any code.
+    """
+    check_code_lengths(code_lengths)
+    if n_bits > 8 * len(data):
+        raise ValueError("Invalid compressed data: the number of bits exceeds the data.")
+
+    # Decoding table: every window of max_length bits starting with the code of a symbol maps to that symbol and its length.
+    max_length = int(code_lengths.max())
+    codes = canonical_codes(code_lengths)
+    table_symbols = np.zeros(2**max_length, dtype=np.uint8)
+    table_lengths = np.zeros(2**max_length, dtype=np.int64)
+    for symbol in np.flatnonzero(code_lengths).tolist():
+        shift = max_length - int(code_lengths[symbol])
+        table_symbols[codes[symbol] << shift:(codes[symbol] + 1) << shift] = symbol
+        table_lengths[codes[symbol] << shift:(codes[symbol] + 1) << shift] = code_lengths[symbol]
+
+    bits = np.concatenate((np.unpackbits(np.frombuffer(data, dtype=np.uint8))[:n_bits], np.zeros(max_length, dtype=np.uint8)))
+    stream = []
+    position = 0
+    for block_start in range(0, n_bits, block_size):
+        block_end = min(block_start + block_size, n_bits)
+        windows = np.zeros(block_end - block_start, dtype=np.int64)
+        for j in range(max_length):
+            windows = (windows << 1) | bits[block_start + j:block_end + j]
+        symbols, lengths = table_symbols[windows].tolist(), table_lengths[windows].tolist()
+        while position < block_end:
+            length = lengths[position - block_start]
+            if length == 0:
+                # Only possible with a single symbol, whose code is "0"
+                raise ValueError("Invalid compressed data: the bits do not match any code.")
+            stream.append(symbols[position - block_start])
+            position += length
+    return np.array(stream, dtype=np.uint8)
+
+
+def compress_sequence(seq, engine="auto"):
+    """
+    Function to compress the received sequence with the block-sorting pipeline of bzip2 and return the compressed data (bytes). 
+    The BWT (built with the selected engine) is split into its runs, the characters of the runs go through the move-to-front 
+    transform, the run lengths are written with RUNA and RUNB, and the resulting symbols are encoded with Huffman codes. 
+    The data starts with the number of bits and the code lengths of the 19 symbols, followed by the packed bits.
+    """
+    run_codes, run_lengths = run_length_encode(burrows_wheeler_conversion(seq, engine=engine))
+    stream = encode_zero_runs(move_to_front(run_codes), run_lengths)
+    code_lengths = huffman_code_lengths(np.bincount(stream, minlength=N_STREAM_SYMBOLS))
+    data, n_bits = huffman_encode(stream, code_lengths)
+    return np.array([n_bits], dtype=np.uint64).tobytes() + code_lengths.tobytes() + data
+
+
+def decompress_sequence(data):
+    """
+    Function to decompress the data returned by compress_sequence and return the original sequence. The BWT is 
+    inverted from its runs, without expanding it (see invert_rlbwt).
+    """
+    if len(data) < 8 + N_STREAM_SYMBOLS:
+        raise ValueError("Invalid compressed data: the header is incomplete.")
+    n_bits = int(np.frombuffer(data[:8], dtype=np.uint64)[0])
+    code_lengths = np.frombuffer(data[8:8 + N_STREAM_SYMBOLS], dtype=np.uint8)
+    mtf, run_lengths = decode_zero_runs(huffman_decode(data[8 + N_STREAM_SYMBOLS:], n_bits, code_lengths))
+    return decode_sequence(invert_rlbwt(inverse_move_to_front(mtf), run_lengths)[:-1])
+
+
+
+
+# Functions for the collection BWT (multi-string BWT of a set of sequences)
+
+def collection_codes(seqs):
+    """
+    Function to concatenate the codes of the received sequences, each one followed by the code of the character "$". 
+    It returns the concatenated codes and the position of each terminator.
+    """
+    lengths = np.array([len(seq) for seq in seqs], dtype=np.int64)
+    terminators = np.cumsum(lengths + 1) - 1
+    codes = np.zeros(int(terminators[-1]) + 1, dtype=np.uint8)
+    is_base = np.ones(len(codes), dtype=bool)
+    is_base[terminators] = False
+    codes[is_base] = encode_sequence(b"".join(seq.encode() if isinstance(seq, str) else bytes(seq) for seq in seqs))
+    return codes, terminators
+
+
+# Suffix array engines that accept an integer text with one symbol per terminator, used for the collection BWT.
+COLLECTION_ENGINES = ["vectorized", "sais", "dc3"]
+
+
+def burrows_wheeler_collection(seqs, engine="vectorized"):
+    """
+    Function to convert the received sequences into the BWT of the collection (bytes), with a single suffix sorting pass. 
+    Each sequence ends with its own terminator: the terminators are distinct and ordered by the position of their sequence 
+    in the collection ($1 < $2 < ... < all the bases), and they are all written as "$" in the BWT. The suffix array is built 
+    by one of the COLLECTION_ENGINES.
+    """
+
+    if engine not in COLLECTION_ENGINES:
+        raise ValueError(f"Unknown collection suffix array engine: {engine}.")
+    codes, terminators = collection_codes(seqs)
+
+    # Integer text: the i-th terminator is the symbol i, and the bases are shifted above all the terminators.
+    text = codes.astype(np.int64) + len(terminators) - 1
+    text[terminators] = np.arange(len(terminators))
+    suffix_array = SA_ENGINES[engine](text)
+
+    # As for a single sequence, the BWT takes the code preceding each suffix. The code preceding the start of a sequence 
+    # is the terminator of the previous one (of the last one for the first sequence), so each sequence is read cyclically.
+    return decode_bytes(np.roll(codes, 1)[suffix_array])
+
+
+def invert_collection(bwt_array):
+    """
+    Function to reverse the BWT of a collection and return the codes of all the sequences (without the terminators) 
+    and their lengths. The i-th row of the first column starts with the terminator of the i-th sequence, so a walk 
+    starting from it reads the i-th sequence backwards until the "$" preceding its start. All the walks move in lockstep, 
+    so the number of steps is the length of the longest sequence rather than the total length.
+    """
+
+    last_to_first = map_last_to_first(bwt_array)
+    n_sequences = int(np.count_nonzero(bwt_array == 0))
+
+    # At each step, every walk still active reads the code of its row and moves to the previous character.
+    rows = np.arange(n_sequences)
+    walks = np.arange(n_sequences)
+    step_walks, step_codes = [], []
+    while len(rows):
+        codes = bwt_array[rows]
+        active = codes != 0
+        rows, walks = last_to_first[rows[active]], walks[active]
+        step_walks.append(walks)
+        step_codes.append(codes[active])
+
+    # The code read by a walk at step t is at position length - 1 - t of its sequence.
+    lengths = np.bincount(np.concatenate(step_walks), minlength=n_sequences) if step_walks else np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(lengths)
+    original_seqs = np.empty(int(ends[-1]) if n_sequences else 0, dtype=np.uint8)
+    for step, (walks, codes) in enumerate(zip(step_walks, step_codes)):
+        original_seqs[ends[walks] - 1 - step] = codes
+    return original_seqs, lengths
+
+
+def revert_burrows_wheeler_collection(bwt):
+    """
+    Function to reverse the BWT of a collection and return the list of the original sequences, in their order in the collection.
+    """
+    original_seqs, lengths = invert_collection(encode_sequence(bwt))
+    text = decode_sequence(original_seqs)
+    starts = np.concatenate(([0], np.cumsum(lengths)))
+    return [text[start:end] for start, end in zip(starts[:-1].tolist(), starts[1:].tolist())]
+
+
+
+
+# Functions for merging BWTs
+
+def interleave(bwt1_array, bwt2_array, from_second):
+    """
+    Function to interleave the codes of two BWTs: the positions where from_second is True take the codes of the 
+    second BWT (in order), the other positions the codes of the first one.
+    """
+    merged = np.empty(len(from_second), dtype=np.uint8)
+    merged[~from_second] = bwt1_array
+    merged[from_second] = bwt2_array
+    return merged
+
+
+def merge_bwt(bwt1, bwt2):
+    """
+    Function to merge the BWTs of two collections (or of two sequences) into the BWT of the combined collection (bytes), 
+    where the sequences of the second collection follow those of the first one, without sorting the suffixes again. 
+    It implements the algorithm of Holt and McMillan: from_second marks the rows of the merged BWT that belong to the 
+    second BWT, and after h passes it is correct for the suffixes sorted by their first h characters. Each pass applies 
+    the LF mapping of both BWTs at once, as a stable sort of the interleaved codes, until nothing changes (at most the 
+    length of the longest common prefix between the suffixes of the two collections plus one).
+    """
+
+    bwt1_array, bwt2_array = encode_sequence(bwt1), encode_sequence(bwt2)
+    n_terminators1 = int(np.count_nonzero(bwt1_array == 0))
+    n_terminators2 = int(np.count_nonzero(bwt2_array == 0))
+
+    # The rows starting with a terminator do not move: the terminators of the first collection are smaller than those of the second one.
+    from_second = np.concatenate((np.zeros(len(bwt1_array), dtype=bool), np.ones(len(bwt2_array), dtype=bool)))
+    while True:
+        # Sorting the interleaved codes (stable) moves each row to the row of the suffix starting one character before it.
+        merged = interleave(bwt1_array, bwt2_array, from_second)
+        next_from_second = from_second[np.argsort(merged, kind='stable')]
+        next_from_second[:n_terminators1] = False
+        next_from_second[n_terminators1:n_terminators1 + n_terminators2] = True
+        if np.array_equal(next_from_second, from_second):
+            return decode_bytes(merged)
+        from_second = next_from_second
+
+
+
+
+# Functions for the dynamic BWT (appending to a stored sequence)
+
+# Number of bases of the blocks of a dynamic BWT, which are also the units written to the stored files.
+DYNAMIC_BLOCK_SIZE = 2**12
+
+# Size of the header of a stored file: the offset of its index and its number of blocks (two little-endian uint64).
+STORED_HEADER_SIZE = 16
+
+
+def fenwick_tree(values):
+    """
+    Function to build and return a Fenwick (binary indexed) tree of the received values (list): element i holds the 
+    sum of the values in (i - lowbit(i), i], so a prefix sum or an update touches only O(log n) elements.
+    """
+    tree = [0] + list(values)
+    for i in range(1, len(tree)):
+        parent = i + (i & -i)
+        if parent < len(tree):
+            tree[parent] += tree[i]
+    return tree
+
+
+def fenwick_add(tree, index, delta):
+    """
+    Function to add delta to the value with the received index (from 0) of a Fenwick tree.
+    """
+    index += 1
+    while index < len(tree):
+        tree[index] += delta
+        index += index & -index
+
+
+def fenwick_prefix(tree, index):
+    """
+    Function to return the sum of the first index values of a Fenwick tree.
+    """
+    total = 0
+    while index > 0:
+        total += tree[index]
+        index -= index & -index
+    return total
+
+
+def fenwick_search(tree, value):
+    """
+    Function to return the largest index whose prefix sum (see fenwick_prefix) is at most the received value, together 
+    with the difference between the value and that sum. With non-negative values this is a single descent of the tree.
+    """
+    index, step = 0, 1 << (len(tree) - 1).bit_length()
+    while step:
+        if index + step < len(tree) and tree[index + step] <= value:
+            index += step
+            value -= tree[index]
+        step >>= 1
+    return index, value
+
+
+def dynamic_bwt(blocks, block_size, offsets=None):
+    """
+    Function to build the dynamic BWT of the received blocks of BWT codes (bytearrays), for the dynamic_prepend function. 
+    It returns a dictionary with the blocks, the counts of each code in each block, Fenwick trees of the lengths and of 
+    these counts, the total counts, the row of the terminator character and the offsets of the blocks in the stored 
+    file (None for the blocks that are not stored yet, or that changed since they were read).
+    """
+    block_counts = np.array([np.bincount(np.frombuffer(block, dtype=np.uint8), minlength=len(ALPHABET)) for block in blocks], dtype=np.int64)
+    terminator_block = next(i for i, block in enumerate(blocks) if 0 in block)
+    dynamic = {"blocks": blocks, "block_size": block_size, "block_counts": block_counts, "totals": block_counts.sum(axis=0).tolist(),
+               "terminator_row": sum(len(block) for block in blocks[:terminator_block]) + blocks[terminator_block].index(0),
+               "offsets": list(offsets) if offsets is not None else [None] * len(blocks)}
+    build_dynamic_trees(dynamic)
+    return dynamic
+
+
+def build_dynamic_trees(dynamic):
+    """
+    Function to (re)build the Fenwick trees of the lengths and of the counts of the blocks of a dynamic BWT.
+    """
+    dynamic["lengths"] = fenwick_tree([len(block) for block in dynamic["blocks"]])
+    dynamic["counts"] = [fenwick_tree(column) for column in dynamic["block_counts"].T.tolist()]
+
+
+def dynamic_prepend(dynamic, code):
+    """
+    Function to update the dynamic BWT of a text X$ into the BWT of cX$, where c is the received code. The terminator 
+    of X$ is replaced by c, and the terminator of the new suffix cX$ is inserted at its row: 1 (for the suffix $) plus 
+    the number of characters smaller than c plus the number of c before the replaced row (the suffixes cZ$ with Z$ < X$). 
+    The blocks and the counts before them are found through the Fenwick trees, so the cost is O(log(n / block_size)) 
+    plus a count and an insertion within a block.
+    """
+    blocks, block_counts, totals = dynamic["blocks"], dynamic["block_counts"], dynamic["totals"]
+
+    # Replace the terminator with c, counting the c before it.
+    block, offset = fenwick_search(dynamic["lengths"], dynamic["terminator_row"])
+    rank = fenwick_prefix(dynamic["counts"][code], block) + blocks[block].count(code, 0, offset)
+    blocks[block][offset] = code
+    fenwick_add(dynamic["counts"][code], block, 1)
+    fenwick_add(dynamic["counts"][0], block, -1)
+    block_counts[block, code] += 1
+    block_counts[block, 0] -= 1
+    dynamic["offsets"][block] = None
+    totals[code] += 1
+    totals[0] -= 1
+
+    # Insert the new terminator (the last block also takes the row following its end).
+    new_row = 1 + sum(totals[1:code]) + rank
+    block, offset = fenwick_search(dynamic["lengths"], new_row)
+    if block == len(blocks):
+        block, offset = block - 1, len(blocks[-1])
+    blocks[block].insert(offset, 0)
+    fenwick_add(dynamic["lengths"], block, 1)
+    fenwick_add(dynamic["counts"][0], block, 1)
+    block_counts[block, 0] += 1
+    dynamic["offsets"][block] = None
+    totals[0] += 1
+    dynamic["terminator_row"] = new_row
+
+    # Split a block when it becomes twice as large as the others, so that the insertions and the counts stay cheap. 
+    # The trees are rebuilt, which costs O(n / block_size) at most once every block_size insertions.
+    if len(blocks[block]) >= 2 * dynamic["block_size"]:
+        half = dynamic["block_size"]
+        left, right = blocks[block][:half], blocks[block][half:]
+        left_counts = np.bincount(np.frombuffer(left, dtype=np.uint8), minlength=len(ALPHABET))
+        blocks[block:block + 1] = [left, right]
+        dynamic["block_counts"] = np.insert(block_counts, block, left_counts, axis=0)
+        dynamic["block_counts"][block + 1] -= left_counts
+        dynamic["offsets"][block:block + 1] = [None, None]
+        build_dynamic_trees(dynamic)
+
+
+def split_blocks(codes, block_size):
+    """
+    Function to split the received codes (array or bytes) into blocks of block_size codes (bytearrays).
+    """
+    data = bytes(codes)
+    return [bytearray(data[start:start + block_size]) for start in range(0, len(data), block_size)]
+
+
+def join_blocks(blocks):
+    """
+    Function to join the blocks of codes of a dynamic BWT into the BWT (bytes).
+    """
+    return decode_bytes(np.frombuffer(b"".join(blocks), dtype=np.uint8))
+
+
+def append_to_reversed_bwt(reversed_bwt, seq, block_size=DYNAMIC_BLOCK_SIZE):
+    """
+    Function to update the BWT of a reversed sequence (bytes) after appending the received bases to the sequence, and 
+    return the new BWT of the reversed sequence (bytes). Appending a base to a sequence changes the order of many of 
+    its suffixes, while prepending it to the reversed sequence only adds one suffix, so each base is prepended to the 
+    reversed sequence with the dynamic_prepend function, at a cost that grows only with the logarithm of the length.
+    """
+    dynamic = dynamic_bwt(split_blocks(encode_sequence(reversed_bwt), block_size), block_size)
+    for code in encode_sequence(seq).tolist():
+        dynamic_prepend(dynamic, code)
+    return join_blocks(dynamic["blocks"])
+
+
+def stored_bwt_path(store_dir, seq_id):
+    """
+    Function to return the path of the file of the stored sequence with the received identifier, which can only 
+    contain letters, digits, "_" and "-".
+    """
+    if not seq_id or not all(char.isalnum() or char in "_-" for char in seq_id):
+        raise ValueError(f"Invalid sequence identifier: {seq_id}.")
+    return os.path.join(store_dir, f"{seq_id}.bwt")
+
+
+def lock_stored_bwt(path):
+    """
+    Function to take an exclusive lock on the stored sequence of the received path, so that the requests on the same 
+    identifier (handled by different processes) are serialized. It returns the lock file: the lock is released when 
+    the file is closed.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    lock_file = open(path + ".lock", "a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def write_stored_bwt(path, reversed_bwt, block_size=DYNAMIC_BLOCK_SIZE):
+    """
+    Function to write the BWT of a stored sequence, replacing the previous file only once it is complete. Each writer 
+    uses its own temporary file in the same directory. The file holds a header (the offset of the index and the number 
+    of blocks), the BWT and an index with the offset and the length of each block of block_size bases.
+    """
+    starts = np.arange(0, len(reversed_bwt), block_size, dtype=np.uint64)
+    index = np.column_stack((starts + STORED_HEADER_SIZE, np.minimum(block_size, len(reversed_bwt) - starts))).astype('<u8')
+    header = np.array([STORED_HEADER_SIZE + len(reversed_bwt), len(starts)], dtype='<u8')
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.tobytes())
+            f.write(reversed_bwt)
+            f.write(index.tobytes())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def read_stored_bwt(path):
+    """
+    Function to read the stored file of the received path. It returns the blocks of BWT codes (bytearrays, in order), 
+    their offsets in the file and the size of the file.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    index_offset, n_blocks = np.frombuffer(data, dtype='<u8', count=2).tolist()
+    offsets, lengths = np.frombuffer(data, dtype='<u8', count=2 * n_blocks, offset=index_offset).reshape(-1, 2).T.tolist()
+    codes = ENCODE_TABLE[np.frombuffer(data, dtype=np.uint8)].tobytes()
+    return [bytearray(codes[offset:offset + length]) for offset, length in zip(offsets, lengths)], offsets, len(data)
+
+
+def update_stored_bwt(path, dynamic, file_size):
+    """
+    Function to save a dynamic BWT read from the stored file of the received path. Only the blocks changed since then 
+    are written: they are appended to the file with a new index, and the header is rewritten last to point to it, so 
+    the previous version stays readable until the update is complete. When the stale blocks would make the file more 
+    than twice as large as the BWT, the whole file is rewritten instead.
+    """
+    blocks, offsets = dynamic["blocks"], dynamic["offsets"]
+    length = sum(len(block) for block in blocks)
+    changed = sum(len(block) for block, offset in zip(blocks, offsets) if offset is None)
+    if file_size + changed > 2 * (length + STORED_HEADER_SIZE * (len(blocks) + 1)):
+        write_stored_bwt(path, join_blocks(blocks), dynamic["block_size"])
+        return
+
+    with open(path, "r+b") as f:
+        f.seek(file_size)
+        position = file_size
+        for i, block in enumerate(blocks):
+            if offsets[i] is None:
+                f.write(decode_bytes(np.frombuffer(block, dtype=np.uint8)))
+                offsets[i] = position
+                position += len(block)
+        f.write(np.column_stack((offsets, [len(block) for block in blocks])).astype('<u8').tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+        f.seek(0)
+        f.write(np.array([position, len(blocks)], dtype='<u8').tobytes())
+
+
+def store_sequence(store_dir, seq_id, seq, engine="auto"):
+    """
+    Function to store the received sequence with the received identifier in store_dir, as the BWT of the reversed 
+    sequence (built with the selected engine), and return it. The stored sequence can then grow through append_sequence.
+    """
+    path = stored_bwt_path(store_dir, seq_id)
+    reversed_bwt = burrows_wheeler_conversion(encode_sequence(seq)[::-1], engine=engine)
+    with lock_stored_bwt(path):
+        write_stored_bwt(path, reversed_bwt)
+    return reversed_bwt
+
+
+def append_sequence(store_dir, seq_id, seq):
+    """
+    Function to append the received bases to the stored sequence with the received identifier, updating its BWT 
+    incrementally, and return the new BWT of the reversed sequence. Only the blocks of the BWT changed by the 
+    appended bases are written to the stored file.
+    """
+    path = stored_bwt_path(store_dir, seq_id)
+    if not os.path.exists(path):
+        raise ValueError(f"No stored sequence with identifier {seq_id}.")
+
+    # The lock is held from the read to the update of the file, so that no concurrent append is lost.
+    with lock_stored_bwt(path):
+        blocks, offsets, file_size = read_stored_bwt(path)
+        dynamic = dynamic_bwt(blocks, DYNAMIC_BLOCK_SIZE, offsets)
+        for code in encode_sequence(seq).tolist():
+            dynamic_prepend(dynamic, code)
+        update_stored_bwt(path, dynamic, file_size)
+    return join_blocks(dynamic["blocks"])
+
+
+
+
+# Functions for the checkpointed BWT
+
+def burrows_wheeler_checkpoints(seq, interval=2**16, engine="auto"):
+    """
+    Function to convert the received sequence in the BWT format (bytes) together with its checkpoints: the rows of the 
+    suffixes starting at the positions multiple of interval, and these positions. The checkpoints are taken from the 
+    suffix array, so the "direct" engine (without suffix array) is replaced with the vectorized engine.
+    """
+    seq_array = np.append(encode_sequence(seq), np.uint8(0))
+    if engine == "auto":
+        engine = select_sa_engine(seq_array)
+    if engine == "direct":
+        engine = "vectorized"
+    if engine not in SA_ENGINES:
+        raise ValueError(f"Unknown suffix array engine: {engine}.")
+
+    suffix_array = SA_ENGINES[engine](seq_array)
+    checkpoint_rows = np.flatnonzero(suffix_array % interval == 0)
+    return decode_bytes(np.roll(seq_array, 1)[suffix_array]), checkpoint_rows, suffix_array[checkpoint_rows]
+
+
+def format_checkpoints(bwt, checkpoint_rows, checkpoint_positions):
+    """
+    Function to write a BWT with its checkpoints (bytes): the BWT, followed by "#" and the "row:position" pairs separated by ",".
+    """
+    return bwt + b"#" + ",".join(f"{row}:{position}" for row, position in zip(checkpoint_rows.tolist(), checkpoint_positions.tolist())).encode()
+
+
+def parse_checkpoints(data):
+    """
+    Function to read a BWT with its checkpoints written by format_checkpoints (str or bytes). It returns the BWT (bytes), 
+    the rows and the positions of the checkpoints, and raises a ValueError if the format is invalid.
+    """
+    data = data.encode() if isinstance(data, str) else bytes(data)
+    bwt, _, table = data.partition(b"#")
+    try:
+        pairs = np.array([pair.split(b":") for pair in table.split(b",")] if table else np.zeros((0, 2)), dtype=np.int64)
+    except ValueError:
+        raise ValueError("Invalid checkpoints: they must be row:position pairs separated by ','.")
+    if pairs.ndim != 2 or pairs.shape[1] != 2 or np.any(pairs < 0) or np.any(pairs >= len(bwt)):
+        raise ValueError("Invalid checkpoints: they must be row:position pairs separated by ','.")
+    return bwt, pairs[:, 0], pairs[:, 1]
+
+
+def revert_burrows_wheeler_checkpoints(data, n_workers=None):
+    """
+    Function to reverse a BWT with its checkpoints (see format_checkpoints) and return the original sequence.
+    """
+    bwt, checkpoint_rows, checkpoint_positions = parse_checkpoints(data)
+    return decode_sequence(invert_bwt_checkpoints(encode_sequence(bwt), checkpoint_rows, checkpoint_positions, n_workers)[:-1])
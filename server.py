@@ -1,17 +1,74 @@
 import sys
+import time
+import base64
 import socket
 import argparse
 import logging
 import multiprocessing
-from conversion_functions import burrows_wheeler_conversion, revert_burrows_wheeler
+from concurrent.futures import ProcessPoolExecutor
+from conversion_functions import (burrows_wheeler_conversion, burrows_wheeler_external_blocks, revert_burrows_wheeler, encode_sequence,
+                                  select_sa_engine, reserve_workspace, run_length_encode, format_rlbwt, format_rlbwt_blocks, revert_rlbwt, compress_sequence, decompress_sequence,
+                                  burrows_wheeler_collection, revert_burrows_wheeler_collection, merge_bwt, store_sequence, append_sequence,
+                                  burrows_wheeler_checkpoints, format_checkpoints, revert_burrows_wheeler_checkpoints,
+                                  SA_ENGINES, REVERT_ENGINES, ENGINE_THRESHOLDS)
+from calibration import run_calibration, load_calibration
 
 
 # Configure logging to record server activity
 logging.basicConfig(filename="server_activity.log", level=logging.INFO, format="%(asctime)s - PID %(process)d - %(levelname)s - %(message)s", filemode="a")
 
-def handle_request(conn, addr):
+def parse_operation(header):
     """
-    Function to handle client requests
+    Function to split the header of a request into the operation to perform and its options. The options are 
+    "key=value" pairs following the operation, separated by spaces (e.g. "BWT engine=sais").
+    """
+    operation, *options = header.split()
+    return operation, dict(option.split("=", 1) for option in options)
+
+
+def request_engine(seq_array, options, settings):
+    """
+    Function to return the suffix array engine of a request: the one selected by the client, if any, otherwise the one 
+    of the server. If the engine is "auto", it is selected by the select_sa_engine function using the thresholds of the server.
+    """
+    engine = options.get("engine", settings["sa_engine"])
+    if engine == "auto":
+        engine = select_sa_engine(seq_array, **settings["thresholds"])
+    return engine
+
+
+def bwt_mode(seq_length, options, settings):
+    """
+    Function to return how a BWT request is converted: "checkpoints", "external" (with mode=external, or for sequences 
+    at least "external_threshold" long) or "memory". The checkpoints are taken from the suffix array in memory and are 
+    not run-length encoded, so a request combining them with format=rle or with the external-memory conversion raises 
+    a ValueError, which is sent back to the client as an error.
+    """
+    external_threshold = settings["external_threshold"]
+    external = options.get("mode") == "external" or (external_threshold is not None and seq_length >= external_threshold)
+    if "checkpoints" in options:
+        if options.get("format") == "rle":
+            raise ValueError("The checkpoints cannot be combined with the RLBWT format (format=rle).")
+        if external:
+            raise ValueError("The checkpoints need the suffix array in memory, so they cannot be combined with the external-memory conversion.")
+        return "checkpoints"
+    return "external" if external else "memory"
+
+
+def handle_request(conn, addr, settings):
+    """
+    Function to handle client requests. The settings dictionary holds the configuration of the server. The suffix array 
+    engine of the server ("sa_engine") is used for BWT requests unless the client selects a different one. If the engine 
+    is "auto", it is selected for each request by the select_sa_engine function using the "thresholds" of the server. 
+    Sequences at least "external_threshold" long (or requested with mode=external) are converted in external memory, 
+    with the scratch files in "scratch_dir". The inverse BWT engine of the server ("revert_engine") is used for REVERT requests.
+    With the format=rle option, the BWT is sent (BWT) or received (REVERT) in the RLBWT format. With the checkpoints=interval 
+    option, the BWT is sent with its checkpoints, and a REVERT request containing checkpoints is inverted from them. COMPRESS requests return 
+    the sequence compressed by the compress_sequence function, and DECOMPRESS requests reverse it (base64 on the socket). 
+    MBWT requests return the BWT of a collection of sequences separated by ",", and MREVERT requests reverse it. 
+    MERGE requests return the BWT of the collection combining two BWTs separated by ",". STORE requests save a sequence 
+    with an identifier (id=name) in "store_dir", and APPEND requests append bases to it, updating its BWT incrementally: 
+    both return the BWT of the reversed stored sequence.
     """
 
     logging.info("Starting a new process...") 
@@ -28,20 +85,96 @@ def handle_request(conn, addr):
                 break
             raw_seq_info += data
 
-        # Decode the received data and store the operation to perform and the sequence to convert
-        seq_info = raw_seq_info.decode()
-        operation, seq_to_convert = seq_info.split(": ")
+        # Store the operation to perform, its options and the sequence to convert. Only the header is decoded, 
+        # the sequence is passed as bytes to the conversion functions, which encode it directly.
+        header, seq_to_convert = raw_seq_info.split(b": ")
+        operation, options = parse_operation(header.decode())
+        del raw_seq_info
 
-        # Execute the requested operation (BWT or REVERT)
+        # Execute the requested operation (BWT, REVERT, COMPRESS, DECOMPRESS, MBWT, MREVERT, MERGE, STORE or APPEND)
         if operation == "BWT":
-            result = burrows_wheeler_conversion(seq_to_convert)
-            logging.info(f"BWT operation completed for {addr}")
+            mode = bwt_mode(len(seq_to_convert), options, settings)
+            if mode == "external":
+                # The received bytes are encoded into the scratch files a block at a time, and the BWT is streamed to the 
+                # client from the disk-backed suffix array, a block at a time, while it is sent (run-length encoded on the 
+                # fly with format=rle): neither the codes nor the BWT are held in memory as a whole.
+                result = burrows_wheeler_external_blocks(seq_to_convert, scratch_dir=settings["scratch_dir"], block_size=settings["external_block_size"])
+                if options.get("format") == "rle":
+                    result = format_rlbwt_blocks(result)
+                logging.info(f"BWT operation started for {addr} in external memory, streaming the result")
+            else:
+                seq_array = encode_sequence(seq_to_convert)
+                if mode == "checkpoints":
+                    # The BWT is followed by the checkpoints (row of the suffix starting at every interval-th position), taken from the suffix array.
+                    engine = request_engine(seq_array, options, settings)
+                    result = format_checkpoints(*burrows_wheeler_checkpoints(seq_array, int(options["checkpoints"]), engine=engine))
+                    logging.info(f"BWT operation completed for {addr} using the {engine} engine, with a checkpoint every {options['checkpoints']} bases")
+                else:
+                    engine = request_engine(seq_array, options, settings)
+                    result = burrows_wheeler_conversion(seq_array, engine=engine)
+                    logging.info(f"BWT operation completed for {addr} using the {engine} engine")
+
+                # With format=rle, the BWT is sent in the RLBWT format (each run as its character and its length).
+                if options.get("format") == "rle":
+                    bwt_length = len(result)
+                    result = format_rlbwt(*run_length_encode(result))
+                    logging.info(f"BWT of {bwt_length} characters sent as a RLBWT of {len(result)} bytes")
+        elif operation == "COMPRESS":
+            # The compressed data is binary, so it is sent in base64 (which never contains the end delimiter).
+            seq_array = encode_sequence(seq_to_convert)
+            engine = request_engine(seq_array, options, settings)
+            result = base64.b64encode(compress_sequence(seq_array, engine=engine))
+            logging.info(f"COMPRESS operation completed for {addr} using the {engine} engine: {len(seq_array)} bases compressed into {len(result)} bytes")
+        elif operation == "MBWT":
+            # The sequences of the collection are separated by ","
+            seqs = seq_to_convert.split(b",")
+            engine = options.get("engine", "vectorized")
+            start = time.perf_counter()
+            result = burrows_wheeler_collection(seqs, engine=engine)
+            elapsed = time.perf_counter() - start
+            logging.info(f"MBWT operation completed for {addr} using the {engine} engine: {len(seqs)} sequences in {elapsed:.2f} s "
+                         f"({len(seqs) / elapsed:.0f} sequences per second)")
+        elif operation == "MREVERT":
+            start = time.perf_counter()
+            seqs = revert_burrows_wheeler_collection(seq_to_convert)
+            elapsed = time.perf_counter() - start
+            result = ",".join(seqs).encode()
+            logging.info(f"MREVERT operation completed for {addr}: {len(seqs)} sequences in {elapsed:.2f} s "
+                         f"({len(seqs) / elapsed:.0f} sequences per second)")
+        elif operation == "MERGE":
+            bwt1, bwt2 = seq_to_convert.split(b",")
+            result = merge_bwt(bwt1, bwt2)
+            logging.info(f"MERGE operation completed for {addr}: BWTs of {len(bwt1)} and {len(bwt2)} characters merged")
+        elif operation == "STORE":
+            seq_array = encode_sequence(seq_to_convert)
+            engine = request_engine(seq_array, options, settings)
+            result = store_sequence(settings["store_dir"], options.get("id"), seq_array, engine=engine)
+            logging.info(f"STORE operation completed for {addr} using the {engine} engine: sequence {options.get('id')} of {len(seq_array)} bases stored")
+        elif operation == "APPEND":
+            start = time.perf_counter()
+            result = append_sequence(settings["store_dir"], options.get("id"), seq_to_convert)
+            logging.info(f"APPEND operation completed for {addr}: {len(seq_to_convert)} bases appended to sequence {options.get('id')} "
+                         f"({len(result) - 1} bases) in {time.perf_counter() - start:.2f} s")
+        elif operation == "DECOMPRESS":
+            result = decompress_sequence(base64.b64decode(seq_to_convert, validate=True)).encode()
+            logging.info(f"DECOMPRESS operation completed for {addr}")
+        elif b"#" in seq_to_convert:
+            # The BWT is followed by its checkpoints: one LF walk starts from each of them.
+            result = revert_burrows_wheeler_checkpoints(seq_to_convert).encode()
+            logging.info(f"REVERT operation completed for {addr} from the checkpoints")
+        elif options.get("format") == "rle":
+            # The RLBWT is reverted without expanding it.
+            result = revert_rlbwt(seq_to_convert).encode()
+            logging.info(f"REVERT operation completed for {addr} from the RLBWT")
         else:
-            result = revert_burrows_wheeler(seq_to_convert)
-            logging.info(f"REVERT operation completed for {addr}")
+            result = revert_burrows_wheeler(seq_to_convert, engine=settings["revert_engine"], as_bytes=True)
+            logging.info(f"REVERT operation completed for {addr} using the {settings['revert_engine']} engine")
 
-        # Send the result back to the client
-        conn.sendall((result + "\n").encode())
+        # Send the result (bytes, or the blocks streamed by the external-memory conversion) back to the client, followed 
+        # by the end delimiter without copying the result. An error raised before the first block is still reported.
+        for block in ([result] if isinstance(result, (bytes, bytearray)) else result):
+            conn.sendall(block)
+        conn.sendall(end)
         logging.info(f"All data successfully sent to {addr}.")         
 
     except socket.timeout:
@@ -52,6 +185,12 @@ def handle_request(conn, addr):
         logging.error(f"SOCKET ERROR: {e}.")
     except Exception as e:
         logging.error(f"UNEXPECTED ERROR: {e}.")
+        # Report the error to the client, which would otherwise wait for the result (the server process 
+        # still holds its copy of the connection, so closing it here does not end the connection)
+        try:
+            conn.sendall(f"ERROR: {e}\n".encode())
+        except socket.error:
+            pass
     finally:
         # Close the connection with the client
         conn.close()
@@ -69,7 +208,7 @@ def validation_server(host, port, n_processes):
                 raise ValueError(f"Invalid port: {port}. Port number must be between 1 and 65535.")
             socket.gethostbyname(host)
 
-            # The number of processes to manage simultaneously with multiprocessing.Pool depends on the number of CPU cores available. 
+            # The number of processes to manage simultaneously with the pool of processes depends on the number of CPU cores available. 
             # Default is the number of CPU cores - 1 since the tasks performed by the server are mainly CPU-bound.
             # Advanced users can specify a different number via command line. If this number is less than 1 or more than twice the number
             # of CPU cores, a ValueError is raised.
@@ -93,23 +232,88 @@ def starting():
     logging.info("Server is starting...")
 
     parser = argparse.ArgumentParser(description = "Implementation of a server along with a corresponding client to process DNA sequences.\n"
-                                     "Supported operations:\n  - BWT: Burrows-Wheeler Transform.\n  - REVERT: Reverse the transformation.",
+                                     "Supported operations:\n  - BWT: Burrows-Wheeler Transform.\n  - REVERT: Reverse the transformation.\n"
+                                     "  - COMPRESS: Block-sorting compression.\n  - DECOMPRESS: Reverse the compression.\n"
+                                     "  - MBWT: BWT of a collection of sequences.\n  - MREVERT: Reverse the collection BWT.\n"
+                                     "  - MERGE: Merge two BWTs.\n  - STORE: Store a sequence.\n  - APPEND: Append bases to a stored sequence.",
                                      formatter_class = argparse.RawTextHelpFormatter)
 
     # Parse command-line arguments for host, port, and number of processes to run simultaneously
     parser.add_argument("-H", "--host", default = "localhost", help = "Host address for the server. Default: localhost.")
     parser.add_argument("-p", "--port", type = int, default = 12345, help = "Port for the server. Default: 12345.")
-    parser.add_argument("--processes", type = int, default = max(1, multiprocessing.cpu_count() - 1), help = "Number of processes to run simulatneously.\n"
-                        "Default: number of CPU cores - 1 (at least 1).\nIt is highly recommended to leave the default unless you have a specific reason to change it.\n"
+    parser.add_argument("--processes", type = int, help = "Number of processes to run simulatneously.\n"
+                        "Default: the value measured by the calibration, if available. Otherwise, number of CPU cores - 1 (at least 1).\n"
+                        "It is highly recommended to leave the default unless you have a specific reason to change it.\n"
                         "Advanced users can specify a number between 1 and twice the number of CPU cores (included).")
+    parser.add_argument("--sa-engine", default = "auto", choices = ["auto", "direct"] + list(SA_ENGINES), help = "Suffix array engine used for BWT requests,\n"
+                        "unless the client selects a different one. Default: auto (selected for each request\nbased on the length and the repetitiveness of the sequence).")
+    parser.add_argument("--revert-engine", choices = list(REVERT_ENGINES), help = "Inverse BWT engine used for REVERT requests.\n"
+                        "Default: the fastest one measured by the calibration, if available. Otherwise, sequential.")
+
+    # Parse command-line arguments for the thresholds used to select the suffix array engine ("auto"). 
+    # The defaults are the values of the calibration, if available.
+    parser.add_argument("--small-threshold", type = int, help = "Sequences shorter than this use the doubling engine.\n"
+                        f"Default: {ENGINE_THRESHOLDS['small_length']}.")
+    parser.add_argument("--direct-threshold", type = int, help = "Sequences at least this long are converted directly, without the suffix array.\n"
+                        f"Default: {ENGINE_THRESHOLDS['direct_length']}.")
+    parser.add_argument("--parallel-threshold", type = int, help = "Sequences at least this long use the parallel engine (on several CPU cores).\n"
+                        f"Default: {ENGINE_THRESHOLDS['parallel_length']}.")
+    parser.add_argument("--large-threshold", type = int, help = "Sequences at least this long use the linear-time engine.\n"
+                        f"Default: {ENGINE_THRESHOLDS['large_length']}.")
+    parser.add_argument("--min-kmer-diversity", type = float, help = "Sequences with a lower k-mer diversity (fraction of distinct 12-mers)\n"
+                        f"are considered repetitive and use the linear-time engine. Default: {ENGINE_THRESHOLDS['min_kmer_diversity']}.")
+    parser.add_argument("--max-run-length", type = float, help = "Sequences with a higher average run length are considered repetitive\n"
+                        f"and use the linear-time engine. Default: {ENGINE_THRESHOLDS['max_run_length']}.")
+    parser.add_argument("--linear-engine", choices = ["sais", "dc3"], help = "Linear-time engine used for huge or repetitive sequences.\n"
+                        f"Default: {ENGINE_THRESHOLDS['linear_engine']}.")
+
+    # Parse command-line arguments for the external-memory conversion of sequences larger than the available memory
+    parser.add_argument("--external-threshold", type = int, help = "Sequences at least this long are converted in external memory.\n"
+                        "Default: none (only the requests with mode=external).")
+    parser.add_argument("--scratch-dir", help = "Directory for the scratch files of the external-memory conversion.\n"
+                        "Default: the temporary directory of the system.")
+    parser.add_argument("--external-block-size", type = int, default = 2**22, help = "Number of suffixes loaded in memory at a time\n"
+                        "by the external-memory conversion. Default: 4194304.")
+
+    # Parse command-line arguments for the stored sequences
+    parser.add_argument("--store-dir", default = "bwt_store", help = "Directory where the sequences of the STORE and APPEND operations are kept\n"
+                        "(as the BWT of the reversed sequence). Default: bwt_store.")
+
+    # Parse command-line arguments for the workspace of the processes
+    parser.add_argument("--workspace-length", type = int, default = 0, help = "Each process preallocates the buffers of its workspace for sequences\n"
+                        "of this length, and reuses them across requests (they grow on demand). Default: 0.")
+
+    # Parse command-line arguments for the calibration
+    parser.add_argument("--calibrate", action = "store_true", help = "Benchmark the engines and the number of processes on this machine before starting,\n"
+                        "and save the results in the calibration file.")
+    parser.add_argument("--calibration-file", default = "server_calibration.json", help = "Calibration file used for the defaults of the thresholds,\n"
+                        "the inverse BWT engine and the number of processes. Default: server_calibration.json.")
     
     args = parser.parse_args()
 
+    # Run the calibration if requested, otherwise load the calibration file (if it exists)
+    calibration = run_calibration(args.calibration_file) if args.calibrate else load_calibration(args.calibration_file)
+    if calibration is None:
+        calibration = {"thresholds": ENGINE_THRESHOLDS, "revert_engine": "sequential", "processes": max(1, multiprocessing.cpu_count() - 1)}
+        logging.info(f"Calibration file {args.calibration_file} not found. Using the default settings.")
+
     # Validation of the inputs provided using the validation_server function
-    host, port, n_processes = validation_server(args.host, args.port, args.processes)
+    n_processes = args.processes if args.processes is not None else calibration["processes"]
+    host, port, n_processes = validation_server(args.host, args.port, n_processes)
 
     logging.info(f"Validation successful. Server can manage {n_processes} processes simultaneously")
 
+    # Thresholds used to select the suffix array engine of each request: the command-line arguments override the calibration
+    thresholds = dict(ENGINE_THRESHOLDS, **calibration["thresholds"])
+    overrides = {"small_length": args.small_threshold, "direct_length": args.direct_threshold, "parallel_length": args.parallel_threshold,
+                 "large_length": args.large_threshold, "min_kmer_diversity": args.min_kmer_diversity, "max_run_length": args.max_run_length,
+                 "linear_engine": args.linear_engine}
+    thresholds.update({key: value for key, value in overrides.items() if value is not None})
+    revert_engine = args.revert_engine or calibration["revert_engine"]
+    logging.info(f"Suffix array engine: {args.sa_engine}. Selection thresholds: {thresholds}. Inverse BWT engine: {revert_engine}")
+    settings = {"sa_engine": args.sa_engine, "thresholds": thresholds, "revert_engine": revert_engine, "external_threshold": args.external_threshold,
+                "scratch_dir": args.scratch_dir, "external_block_size": args.external_block_size, "store_dir": args.store_dir}
+
     # Create a socket for the server
     s = socket.socket()
 
@@ -123,15 +327,17 @@ def starting():
         with open("server_activity.log", "a") as f:
             f.write("\n")
 
-        # Use multiprocessing.Pool to handle simultaneous connections from different clients. 
-        with multiprocessing.Pool(processes=n_processes) as pool:
+        # Use a pool of processes to handle simultaneous connections from different clients. The workers of a ProcessPoolExecutor 
+        # are not daemonic, so the parallel engine can use other processes to sort the suffixes of a single large request.
+        # Each worker keeps its own workspace of conversion buffers for its whole lifetime.
+        with ProcessPoolExecutor(max_workers=n_processes, initializer=reserve_workspace, initargs=(args.workspace_length,)) as pool:
             while True:
                 conn, addr = s.accept()      # Accept the client connection
                 logging.info(f"Got connection from {addr}")
                 conn.send(b"Welcome. Waiting for data...")      # Send a welcome message to the client
                 conn.settimeout(300)      # a large limit to ensure that also a large sequence can be sent back to the client
 
-                pool.apply_async(handle_request, args=(conn, addr))      # Process in a separate process
+                pool.submit(handle_request, conn, addr, settings)      # Process in a separate process
 
     except socket.error as e:
         logging.error(f"SOCKET ERROR: {e}.")
@@ -0,0 +1,59 @@
+import os
+import json
+import unittest
+from calibration import derive_thresholds, load_calibration, SMALL_LENGTHS, LARGE_LENGTHS, REVERT_LENGTHS
+
+
+# The benchmarks are simulated, so that the thresholds derived from them are known in advance.
+def simulated_benchmarks(linear_faster_on_repeats):
+    sa = {"doubling": {str(length): length * 1e-6 for length in SMALL_LENGTHS},
+          "vectorized": {str(length): 1e-4 + length * 1e-7 for length in SMALL_LENGTHS + LARGE_LENGTHS},
+          "parallel": {str(length): 5e-2 + length * 1e-8 for length in SMALL_LENGTHS + LARGE_LENGTHS},
+          "direct": {str(length): 1e-2 + length * 5e-8 for length in SMALL_LENGTHS + LARGE_LENGTHS},
+          "sais": {str(length): length * 1e-7 + (1 if length < LARGE_LENGTHS[-1] else 0) for length in SMALL_LENGTHS + LARGE_LENGTHS},
+          "dc3": {str(length): length * 1e-8 for length in SMALL_LENGTHS + LARGE_LENGTHS}}
+    repetitive = {"vectorized": 1.0, "sais": 0.5 if linear_faster_on_repeats else 1.5, "dc3": 0.2}
+    # The linear engine is chosen by its peak memory (bytes per base), even if the other one is faster.
+    memory = {"sais": 15.0, "dc3": 99.0}
+    return {"sa": sa, "sa_repetitive": repetitive, "sa_memory": memory, "revert": {"sequential": {str(length): 1.0 for length in REVERT_LENGTHS},
+                                                                                "pointer_jumping": {str(length): 0.5 for length in REVERT_LENGTHS},
+                                                                                "bidirectional": {str(length): 0.7 for length in REVERT_LENGTHS},
+                                                                                "sampled": {str(length): 2.0 for length in REVERT_LENGTHS}}}
+
+
+class TestCalibration(unittest.TestCase):
+
+    def test_derive_thresholds(self):
+        """Thresholds derived from the crossovers between the engines."""
+        thresholds, revert_engine = derive_thresholds(simulated_benchmarks(linear_faster_on_repeats=True))
+        self.assertEqual(thresholds["small_length"], 128)
+        self.assertEqual(thresholds["linear_engine"], "sais")
+        self.assertEqual(thresholds["large_length"], LARGE_LENGTHS[-1])
+        self.assertEqual(thresholds["parallel_length"], LARGE_LENGTHS[-1])
+        self.assertEqual(thresholds["direct_length"], LARGE_LENGTHS[1])
+        self.assertEqual(thresholds["min_kmer_diversity"], 0.5)
+        self.assertEqual(revert_engine, "pointer_jumping")
+
+
+    def test_derive_thresholds_without_repeats(self):
+        """The repetitiveness probe is disabled if the linear engine is slower on repetitive sequences."""
+        thresholds, revert_engine = derive_thresholds(simulated_benchmarks(linear_faster_on_repeats=False))
+        self.assertEqual(thresholds["min_kmer_diversity"], 0.0)
+        self.assertEqual(thresholds["max_run_length"], float(LARGE_LENGTHS[-1]))
+
+
+    def test_load_calibration(self):
+        """Calibration file loaded if present, None otherwise."""
+        file = "calibration_test.json"
+        try:
+            self.assertIsNone(load_calibration(file))
+            with open(file, "w") as f:
+                json.dump({"processes": 3}, f)
+            self.assertEqual(load_calibration(file), {"processes": 3})
+        finally:
+            if os.path.exists(file):
+                os.remove(file)
+
+
+if __name__ == "__main__":
+    unittest.main()
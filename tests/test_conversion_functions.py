@@ -1,15 +1,296 @@
+import os
+import shutil
+import tempfile
 import unittest
-from conversion_functions import burrows_wheeler_conversion, revert_burrows_wheeler
+import multiprocessing
+import numpy as np
+from conversion_functions import (burrows_wheeler_conversion, revert_burrows_wheeler, build_suffix_array,
+                                  build_suffix_array_vectorized, build_suffix_array_parallel, build_suffix_array_sais, build_suffix_array_dc3, burrows_wheeler_external, burrows_wheeler_external_blocks,
+                                  burrows_wheeler_direct, index_dtype, cyclic_shift, workspace_buffer,
+                                  encode_sequence, decode_sequence, kmer_ranks, pack_rank_pairs, check_rank_pairs_length, select_sa_engine,
+                                  run_length_encode, format_rlbwt, format_rlbwt_blocks, parse_rlbwt, revert_rlbwt, move_to_front, inverse_move_to_front,
+                                  encode_zero_runs, decode_zero_runs, compress_sequence, decompress_sequence,
+                                  burrows_wheeler_collection, revert_burrows_wheeler_collection, merge_bwt,
+                                  append_to_reversed_bwt, store_sequence, append_sequence, read_stored_bwt, join_blocks, map_last_to_first,
+                                  burrows_wheeler_checkpoints, format_checkpoints, parse_checkpoints, revert_burrows_wheeler_checkpoints,
+                                  sample_occurrences, invert_bwt_sampled)
 
 
 # Testing is perfomed considering valid inputs only, as input validation is handled by the client
 class TestConversionFunctions(unittest.TestCase):
 
     def test_burrows_wheeler_conversion(self):
-        self.assertEqual(burrows_wheeler_conversion("ACGTACGTACGTACGTACGT"), "TTTTT$AAAAACCCCCGGGGG")
+        self.assertEqual(burrows_wheeler_conversion("ACGTACGTACGTACGTACGT"), b"TTTTT$AAAAACCCCCGGGGG")
 
     def test_revert_burrows_wheeler(self):
         self.assertEqual(revert_burrows_wheeler("TTTTT$AAAAACCCCCGGGGG"), "ACGTACGTACGTACGTACGT")
+        self.assertEqual(revert_burrows_wheeler(burrows_wheeler_conversion("GATTACA")), "GATTACA")
+        for seq in ["GATTACA", "A", "A" * 300, "ACGTTGCAT" * 50]:
+            self.assertEqual(revert_burrows_wheeler(burrows_wheeler_conversion(seq), engine="pointer_jumping"), seq)
+            self.assertEqual(revert_burrows_wheeler(burrows_wheeler_conversion(seq), engine="sampled"), seq)
+            self.assertEqual(revert_burrows_wheeler(burrows_wheeler_conversion(seq), engine="sampled", as_bytes=True), seq.encode())
+            self.assertEqual(revert_burrows_wheeler(burrows_wheeler_conversion(seq), as_bytes=True), seq.encode())
+        # A sequence long enough to be inverted by two processes, with an odd length to split it into unequal halves.
+        rng = np.random.default_rng(0)
+        seq = "".join(rng.choice(list("ACGT"), 70001))
+        self.assertEqual(revert_burrows_wheeler(burrows_wheeler_conversion(seq), engine="bidirectional"), seq)
+
+    def test_map_last_to_first(self):
+        # The example of the README: BWT of "BANANA$".
+        self.assertEqual(map_last_to_first("ANNB$AA").tolist(), [1, 5, 6, 4, 0, 2, 3])
+
+    def test_select_sa_engine(self):
+        rng = np.random.default_rng(0)
+        random_seq = "".join(rng.choice(list("ACGT"), 20000))
+        self.assertEqual(select_sa_engine("ACGTACGT"), "doubling")
+        self.assertEqual(select_sa_engine(random_seq), "vectorized")
+        self.assertEqual(select_sa_engine(random_seq, large_length=10000), "sais")
+        self.assertEqual(select_sa_engine(random_seq, direct_length=10000, parallel_length=10**9), "direct")
+        self.assertEqual(select_sa_engine("A" * 20000), "sais")
+        self.assertEqual(select_sa_engine("ACGTTGCAT" * 2000, linear_engine="dc3"), "dc3")
+
+    def test_encode_sequence(self):
+        codes = encode_sequence(b"ACGTRYSWKMBDHVNU$")
+        self.assertEqual(codes.dtype, "uint8")
+        self.assertEqual(codes.tolist(), [1, 3, 5, 12, 10, 16, 11, 15, 7, 8, 2, 4, 6, 14, 9, 13, 0])
+        self.assertEqual(decode_sequence(codes), "ACGTRYSWKMBDHVNU$")
+        with self.assertRaises(ValueError):
+            encode_sequence("ACGTX")
+
+    def test_kmer_ranks(self):
+        # ACGT$ takes 3 bits per symbol, so the suffixes are ranked by their first 16 characters (the largest power of 2 fitting in 64 bits).
+        suffix_array, ranks, k = kmer_ranks(encode_sequence("GATTACAGATTACAAAAAGGGTTTCCC$"))
+        self.assertEqual(k, 16)
+        self.assertEqual(suffix_array.tolist(), build_suffix_array("GATTACAGATTACAAAAAGGGTTTCCC$").tolist())
+        self.assertEqual(ranks[suffix_array].tolist(), list(range(28)))
+
+    def test_index_dtype(self):
+        self.assertEqual(index_dtype(1000), np.uint32)
+        self.assertEqual(index_dtype(2**32), np.int64)
+        self.assertEqual(build_suffix_array_vectorized("BANANA$").dtype, np.uint32)
+        # The positions wrap around the end of the string without overflowing the unsigned dtype.
+        shifted = cyclic_shift(np.array([0, 3, 4], dtype=np.uint32), 2, 5)
+        self.assertEqual(shifted.tolist(), [2, 0, 1])
+        self.assertEqual(shifted.dtype, np.uint32)
+
+    def test_workspace_buffer(self):
+        buffer = workspace_buffer("test", 100, np.uint32)
+        self.assertEqual(len(buffer), 100)
+        # Smaller requests reuse the same memory, larger ones grow the buffer.
+        self.assertTrue(np.shares_memory(buffer, workspace_buffer("test", 50, np.uint32)))
+        self.assertFalse(np.shares_memory(buffer, workspace_buffer("test", 200, np.uint32)))
+        self.assertEqual(workspace_buffer("test", 10, np.uint64).dtype, np.uint64)
+
+    def test_check_rank_pairs_length(self):
+        check_rank_pairs_length(2**32 - 1)
+        with self.assertRaises(ValueError):
+            check_rank_pairs_length(2**32)
+
+    def test_pack_rank_pairs(self):
+        keys = pack_rank_pairs(np.array([1, 0, 1, 2]), np.array([5, 7, 2, 0]))
+        self.assertEqual(np.argsort(keys, kind="stable").tolist(), [1, 2, 0, 3])
+        self.assertEqual(int(keys[0]), (1 << 32) + 5)
+
+    def test_build_suffix_array_vectorized(self):
+        self.assertEqual(build_suffix_array_vectorized("BANANA$").tolist(), [6, 5, 3, 1, 0, 4, 2])
+        for seq in ["GATTACAGATTACAAAAAAGGGTTTCCCNNRYACGT$", "A" * 200 + "$", "ACGTTGCA" * 40 + "$"]:
+            self.assertEqual(build_suffix_array_vectorized(seq).tolist(), build_suffix_array(seq).tolist())
+
+    def test_build_suffix_array_parallel(self):
+        # Sequences long enough to be split into segments sorted by two workers.
+        rng = np.random.default_rng(0)
+        for seq in ["".join(rng.choice(list("ACGT"), 70000)) + "$", "ACGTTGCAT" * 8000 + "$"]:
+            self.assertEqual(build_suffix_array_parallel(seq, n_workers=2).tolist(), build_suffix_array_vectorized(seq).tolist())
+
+    def test_build_suffix_array_sais(self):
+        self.assertEqual(build_suffix_array_sais("BANANA$").tolist(), [6, 5, 3, 1, 0, 4, 2])
+        for seq in ["GATTACAGATTACAAAAAAGGGTTTCCCNNRYACGT$", "A" * 200 + "$", "ACG" * 70 + "$"]:
+            self.assertEqual(build_suffix_array_sais(seq).tolist(), build_suffix_array(seq).tolist())
+        self.assertEqual(burrows_wheeler_conversion("ACGTACGTACGTACGTACGT", engine="sais"), b"TTTTT$AAAAACCCCCGGGGG")
+
+    def test_build_suffix_array_dc3(self):
+        self.assertEqual(build_suffix_array_dc3("BANANA$").tolist(), [6, 5, 3, 1, 0, 4, 2])
+        for seq in ["GATTACAGATTACAAAAAAGGGTTTCCCNNRYACGT$", "A" * 200 + "$", "ACG" * 70 + "$"]:
+            self.assertEqual(build_suffix_array_dc3(seq).tolist(), build_suffix_array(seq).tolist())
+        self.assertEqual(burrows_wheeler_conversion("ACGTACGTACGTACGTACGT", engine="dc3"), b"TTTTT$AAAAACCCCCGGGGG")
+
+    def test_burrows_wheeler_direct(self):
+        # A small block size splits the buckets and the groups (e.g. the long run of A) across several blocks.
+        self.assertEqual(burrows_wheeler_direct("ACGTACGTACGTACGTACGT", block_size=4), b"TTTTT$AAAAACCCCCGGGGG")
+        for seq in ["GATTACAGATTACAAAAAAGGGTTTCCCNNRYACGT", "A" * 200, "ACGTTGCA" * 40 + "T" * 50]:
+            self.assertEqual(burrows_wheeler_direct(seq, block_size=16), burrows_wheeler_conversion(seq))
+        self.assertEqual(burrows_wheeler_conversion("ACGTACGTACGTACGTACGT", engine="direct"), b"TTTTT$AAAAACCCCCGGGGG")
+
+    def test_burrows_wheeler_external(self):
+        # A small block size forces the external sort to distribute the keys into buckets on disk.
+        self.assertEqual(burrows_wheeler_external("ACGTACGTACGTACGTACGT", block_size=4), b"TTTTT$AAAAACCCCCGGGGG")
+        for seq in ["GATTACAGATTACAAAAAAGGGTTTCCCNNRYACGT", "A" * 200, "ACGTTGCA" * 40]:
+            self.assertEqual(burrows_wheeler_external(seq, block_size=16), burrows_wheeler_conversion(seq))
+        # The BWT is streamed a block at a time, and the RLBWT is written from the blocks (runs crossing the blocks included).
+        blocks = list(burrows_wheeler_external_blocks(b"ACGTACGTACGTACGTACGT", block_size=4))
+        self.assertEqual([len(block) for block in blocks], [4, 4, 4, 4, 4, 1])
+        self.assertEqual(b"".join(blocks), b"TTTTT$AAAAACCCCCGGGGG")
+        self.assertEqual(b"".join(format_rlbwt_blocks(blocks)), b"T5$1A5C5G5")
+
+    def test_rlbwt(self):
+        self.assertEqual(format_rlbwt(*run_length_encode(b"TTTTT$AAAAACCCCCGGGGG")), b"T5$1A5C5G5")
+        run_codes, run_lengths = parse_rlbwt("A12$1C3")
+        self.assertEqual(decode_sequence(run_codes), "A$C")
+        self.assertEqual(run_lengths.tolist(), [12, 1, 3])
+        self.assertEqual(format_rlbwt(*run_length_encode(b"A" * 12 + b"$" + b"C" * 100)), b"A12$1C100")
+        # Empty runs and a terminator that is missing, repeated or longer than 1 are rejected.
+        for rlbwt in ["5A", "A5T", "", "T5$2A5C5G5", "T5$1A0C5G5", "T5A5", "T5$1$1"]:
+            with self.assertRaises(ValueError):
+                parse_rlbwt(rlbwt)
+
+    def test_revert_rlbwt(self):
+        self.assertEqual(revert_rlbwt("T5$1A5C5G5"), "ACGTACGTACGTACGTACGT")
+        for seq in ["GATTACA", "A" * 200, "ACGTTGCA" * 40 + "T" * 50]:
+            self.assertEqual(revert_rlbwt(format_rlbwt(*run_length_encode(burrows_wheeler_conversion(seq)))), seq)
+
+    def test_move_to_front(self):
+        # The list starts as $ A B C D ..., so the first C is at position 3, then A at position 2 (C A $ B ...).
+        mtf = move_to_front(encode_sequence("CACCA$B"))
+        self.assertEqual(mtf.tolist(), [3, 2, 1, 0, 1, 2, 3])
+        self.assertEqual(decode_sequence(inverse_move_to_front(mtf)), "CACCA$B")
+
+    def test_zero_runs(self):
+        # Run lengths 1, 2, 3 and 5 are followed by no digit, RUNA, RUNB and RUNB RUNA (2 + 2 = 4 repetitions).
+        stream = encode_zero_runs(np.array([1, 2, 3, 4], dtype=np.uint8), np.array([1, 2, 3, 5]))
+        self.assertEqual(stream.tolist(), [3, 4, 0, 5, 1, 6, 1, 0])
+        mtf, run_lengths = decode_zero_runs(stream)
+        self.assertEqual(mtf.tolist(), [1, 2, 3, 4])
+        self.assertEqual(run_lengths.tolist(), [1, 2, 3, 5])
+
+    def test_compress_sequence(self):
+        for seq in ["ACGTACGTACGTACGTACGT", "A", "GATTACAGATTACAAAAAAGGGTTTCCCNNRYACGT", "ACGTTGCAT" * 2000]:
+            self.assertEqual(decompress_sequence(compress_sequence(seq)), seq)
+        self.assertLess(len(compress_sequence("ACGTTGCAT" * 2000)), 100)
+
+    def test_decompress_sequence_corrupt(self):
+        # Header: number of bits (uint64) and the code lengths of the 19 symbols, followed by the packed bits.
+        def payload(n_bits, code_lengths, data=b"\xff" * 4):
+            return np.array([n_bits], dtype=np.uint64).tobytes() + bytes(code_lengths) + data
+        corrupt = [payload(32, [2] + [0] * 18),      # Single symbol with a code of length 2
+                   payload(32, [0] * 19),      # No code at all
+                   payload(32, [1] + [0] * 18),      # Single symbol with code "0", but the bits are all 1
+                   payload(32, [2, 2] + [0] * 17),      # Incomplete prefix code
+                   payload(32, [1, 1, 1] + [0] * 16),      # Over-subscribed prefix code
+                   payload(32, [19, 1] + [0] * 17),      # Code longer than the maximum length
+                   payload(33, [1, 1] + [0] * 17),      # More bits than the data
+                   b"\x00" * 10]      # Incomplete header
+        for data in corrupt:
+            with self.assertRaises(ValueError):
+                decompress_sequence(data)
+
+    def test_burrows_wheeler_collection(self):
+        # The terminators are ordered by sequence ($1 < $2 < ...), and each sequence is preceded by its own terminator.
+        seqs = ["GATTACA", "ACG", "A", "GATTACA", "TTT"]
+        for engine in ["vectorized", "sais", "dc3"]:
+            self.assertEqual(burrows_wheeler_collection(seqs, engine=engine), b"AGAATC$CTT$GGAAAC$$TTTTAA$")
+        self.assertEqual(burrows_wheeler_collection(["ACGTACGTACGTACGTACGT"]), b"TTTTT$AAAAACCCCCGGGGG")
+
+    def test_revert_burrows_wheeler_collection(self):
+        self.assertEqual(revert_burrows_wheeler_collection("AGAATC$CTT$GGAAAC$$TTTTAA$"), ["GATTACA", "ACG", "A", "GATTACA", "TTT"])
+        rng = np.random.default_rng(0)
+        seqs = ["".join(rng.choice(list("ACGT"), rng.integers(1, 30))) for _ in range(100)]
+        self.assertEqual(revert_burrows_wheeler_collection(burrows_wheeler_collection(seqs)), seqs)
+
+    def test_merge_bwt(self):
+        # Two single-sequence BWTs are merged into the BWT of the collection of both sequences.
+        merged = merge_bwt(b"TTTTT$AAAAACCCCCGGGGG", burrows_wheeler_conversion("GATTACA"))
+        self.assertEqual(merged, burrows_wheeler_collection(["ACGTACGTACGTACGTACGT", "GATTACA"]))
+        rng = np.random.default_rng(0)
+        seqs = ["".join(rng.choice(list("ACGT"), rng.integers(1, 30))) for _ in range(60)]
+        merged = merge_bwt(burrows_wheeler_collection(seqs[:20]), burrows_wheeler_collection(seqs[20:]))
+        self.assertEqual(merged, burrows_wheeler_collection(seqs))
+        self.assertEqual(merge_bwt(b"T$AAA", b"T$AAA"), burrows_wheeler_collection(["AAAT", "AAAT"]))
+
+    def test_append_to_reversed_bwt(self):
+        # Small blocks force the blocks to be split while the bases are prepended to the reversed sequence.
+        rng = np.random.default_rng(0)
+        for block_size in [1, 4, 4096]:
+            seq, appended = "".join(rng.choice(list("ACGTN"), 50)), "".join(rng.choice(list("ACGT"), 30))
+            reversed_bwt = append_to_reversed_bwt(burrows_wheeler_conversion(seq[::-1]), appended, block_size=block_size)
+            self.assertEqual(reversed_bwt, burrows_wheeler_conversion((seq + appended)[::-1]))
+
+    def test_append_sequence(self):
+        store_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(store_sequence(store_dir, "ref", "GATTA"), burrows_wheeler_conversion("ATTAG"))
+            self.assertEqual(append_sequence(store_dir, "ref", "CA"), burrows_wheeler_conversion("ACATTAG"))
+            self.assertTrue(os.path.exists(os.path.join(store_dir, "ref.bwt")))
+            with self.assertRaises(ValueError):
+                append_sequence(store_dir, "missing", "CA")
+            with self.assertRaises(ValueError):
+                store_sequence(store_dir, "../ref", "GATTA")
+
+            # An append writes only the blocks it changes and the index, not the whole stored BWT.
+            rng = np.random.default_rng(0)
+            seq = "".join(rng.choice(list("ACGT"), 2**18))
+            store_sequence(store_dir, "large", seq)
+            path = os.path.join(store_dir, "large.bwt")
+            size = os.path.getsize(path)
+            for appended in ["A", "CGT", "T" * 100]:
+                seq += appended
+                self.assertEqual(append_sequence(store_dir, "large", appended), burrows_wheeler_conversion(seq[::-1]))
+                self.assertLess(os.path.getsize(path) - size, 2**15)
+                size = os.path.getsize(path)
+            self.assertEqual(join_blocks(read_stored_bwt(path)[0]), burrows_wheeler_conversion(seq[::-1]))
+        finally:
+            shutil.rmtree(store_dir)
+
+    def test_append_sequence_concurrent(self):
+        # Appends on the same identifier from several processes are serialized, so none of them is lost.
+        store_dir = tempfile.mkdtemp()
+        try:
+            store_sequence(store_dir, "ref", "GATTACA")
+            with multiprocessing.Pool(4) as pool:
+                pool.starmap(append_sequence, [(store_dir, "ref", "A")] * 40)
+            blocks, _, _ = read_stored_bwt(os.path.join(store_dir, "ref.bwt"))
+            self.assertEqual(join_blocks(blocks), burrows_wheeler_conversion(("GATTACA" + "A" * 40)[::-1]))
+            self.assertEqual(sorted(os.listdir(store_dir)), ["ref.bwt", "ref.bwt.lock"])
+        finally:
+            shutil.rmtree(store_dir)
+
+    def test_sample_occurrences(self):
+        # Occurrences of $, A, C, G and T before the rows 0, 4, 8, 12, 16 and 20 of the BWT.
+        counts, symbols, samples = sample_occurrences(np.frombuffer(b"TTTTT$AAAAACCCCCGGGGG", dtype=np.uint8), sample_rate=4)
+        self.assertEqual(bytes(symbols.tolist()), b"$ACGT")
+        self.assertEqual(counts[symbols].tolist(), [1, 5, 5, 5, 5])
+        self.assertEqual(samples.tolist(), [[0, 0, 0, 0, 0], [0, 0, 0, 0, 4], [1, 2, 0, 0, 5],
+                                            [1, 5, 1, 0, 5], [1, 5, 5, 0, 5], [1, 5, 5, 4, 5]])
+
+    def test_invert_bwt_sampled(self):
+        rng = np.random.default_rng(0)
+        for seq in ["".join(rng.choice(list("ACGTNRY"), 1000)), "A" * 600]:
+            for sample_rate in [1, 3, 256, 2048]:
+                original_seq = invert_bwt_sampled(burrows_wheeler_conversion(seq), sample_rate=sample_rate)
+                self.assertEqual(decode_sequence(original_seq[:-1]), seq)
+                self.assertEqual(invert_bwt_sampled(burrows_wheeler_conversion(seq), sample_rate=sample_rate, characters=True), (seq + "$").encode())
+        self.assertEqual(decode_sequence(invert_bwt_sampled(encode_sequence("TTTTT$AAAAACCCCCGGGGG"))[:-1]), "ACGTACGTACGTACGTACGT")
+        with self.assertRaises(ValueError):
+            invert_bwt_sampled(b"TTXTT$AAAAACCCCCGGGGG")
+
+    def test_burrows_wheeler_checkpoints(self):
+        # The checkpoints are the rows of the suffixes starting at positions 0, 4, 8, ..., sorted by row.
+        bwt, rows, positions = burrows_wheeler_checkpoints("ACGTACGTACGTACGTACGT", interval=4)
+        self.assertEqual(format_checkpoints(bwt, rows, positions), b"TTTTT$AAAAACCCCCGGGGG#0:20,1:16,2:12,3:8,4:4,5:0")
+        bwt, rows, positions = parse_checkpoints("TTTTT$AAAAACCCCCGGGGG#1:16,5:0")
+        self.assertEqual((bwt, rows.tolist(), positions.tolist()), (b"TTTTT$AAAAACCCCCGGGGG", [1, 5], [16, 0]))
+        for data in ["TTTTT$AAAAACCCCCGGGGG#1:16,5", "TTTTT$AAAAACCCCCGGGGG#30:0", "TTTTT$AAAAACCCCCGGGGG#1:21"]:
+            with self.assertRaises(ValueError):
+                parse_checkpoints(data)
+
+    def test_revert_burrows_wheeler_checkpoints(self):
+        rng = np.random.default_rng(0)
+        seq = "".join(rng.choice(list("ACGT"), 5000))
+        for interval in [1, 7, 1000, 10000]:
+            data = format_checkpoints(*burrows_wheeler_checkpoints(seq, interval=interval))
+            for n_workers in [1, 2]:
+                self.assertEqual(revert_burrows_wheeler_checkpoints(data, n_workers=n_workers), seq)
+        # Any subset of the checkpoints is enough, as the walks always end at the next checkpoint.
+        self.assertEqual(revert_burrows_wheeler_checkpoints("TTTTT$AAAAACCCCCGGGGG#2:12"), "ACGTACGTACGTACGTACGT")
 
 
 if __name__ == "__main__":
@@ -2,7 +2,7 @@ import os
 import unittest
 import multiprocessing
 from client import validation_client
-from server import validation_server 
+from server import validation_server, bwt_mode
 
 
 # The simulated errors will be recorded in the log files, as if they occurred during normal operation.
@@ -177,6 +177,26 @@ class TestValidationClient(unittest.TestCase):
                 os.remove(file)
 
 
+    def test_valid_collection(self):
+        """A multi-record file for the MBWT operation: the sequences of the records are joined by ","."""
+        file = "file1.fasta"
+        operation = "MBWT"
+        host = "localhost"
+        port = 12345
+        try:
+            # Create a temporary file
+            with open(file, "w") as f:
+                f.write("> read 1\nAGCT\nGCT\n")
+                f.write("> read 2\nttag\n")
+            host, port, header, seq = validation_client(host, port, file, operation)
+            self.assertEqual(header, "> read 1")
+            self.assertEqual(seq, "AGCTGCT,TTAG")
+        finally:
+            # Remove the temporary file
+            if os.path.exists(file):
+                os.remove(file)
+
+
 
 # To validate the Host and Port, the validation_server function uses the same logic used by the validation_client function. For this reason, 
 # no examples with invalid Host or Port are provided below.
@@ -209,6 +229,27 @@ class TestValidationServer(unittest.TestCase):
         self.assertEqual(cm.exception.code, 3)
 
 
+class TestBwtMode(unittest.TestCase):
+
+    def test_bwt_mode(self):
+        """Options of a BWT request, with an external threshold of 1000 bases."""
+        settings = {"external_threshold": 1000}
+        self.assertEqual(bwt_mode(10, {}, settings), "memory")
+        self.assertEqual(bwt_mode(10, {"mode": "external"}, settings), "external")
+        self.assertEqual(bwt_mode(1000, {"format": "rle"}, settings), "external")
+        self.assertEqual(bwt_mode(10, {"checkpoints": "4"}, settings), "checkpoints")
+        self.assertEqual(bwt_mode(10**9, {}, {"external_threshold": None}), "memory")
+
+
+    def test_checkpoints_conflicts(self):
+        """The checkpoints cannot be run-length encoded or taken in external memory."""
+        settings = {"external_threshold": 1000}
+        for seq_length, options in [(10, {"checkpoints": "4", "format": "rle"}), (10, {"checkpoints": "4", "mode": "external"}),
+                                    (1000, {"checkpoints": "4"})]:
+            with self.assertRaises(ValueError):
+                bwt_mode(seq_length, options, settings)
+
+
 
 if __name__ == "__main__":
     unittest.main()